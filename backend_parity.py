@@ -0,0 +1,110 @@
+"""
+Compare an encoder inference backend with the PyTorch baseline on a sample corpus.
+
+    python backend_parity.py sample.zip --backend onnx
+    python backend_parity.py sample.zip --backend torch-int8 --sample 100
+
+Both backends embed the same documents. The report gives encoding time, the
+drift of the channel's pair scores and of the composite score, and the pairs
+whose flag verdict (score >= threshold) differs. Switch ENCODER_BACKEND only
+if the drift and flips are acceptable.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from calculate_similarity import calculate_composite_pairs, calculate_similarity_pairs
+from create_embeddings import create_document_embeddings, create_tfidf_embeddings
+from model_registry import get_model, resolve_backend
+from passage_match import FLAG_THRESHOLD
+
+embed_model = 'sentence-transformers/static-similarity-mrl-multilingual-v1'
+paraphrase_model = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+
+def _flips(baseline_pairs, candidate_pairs, threshold):
+    flipped = np.flatnonzero((baseline_pairs.scores >= threshold) != (candidate_pairs.scores >= threshold))
+    return baseline_pairs.labels(flipped)
+
+
+def compare_backends(documents, backend, model=paraphrase_model, channel="paraphrase", baseline="torch",
+                     threshold=FLAG_THRESHOLD, batch_size=256):
+    """
+    Parity report of one backend against the baseline for {team_name: ExtractedDocument}.
+
+    Parameters:
+    - model (str): Encoder under test.
+    - channel (str): "paraphrase" or "context", the composite slot the model fills;
+      the other two channels are computed once and shared by both runs.
+
+    Returns:
+    - dict with timings, max/mean pair score drift per channel and composite, the
+      minimum cosine between the two backends' document vectors and the flipped pairs.
+    """
+    other_model = embed_model if channel == "paraphrase" else paraphrase_model
+    other_pairs = calculate_similarity_pairs(create_document_embeddings(documents, other_model, batch_size=batch_size))
+    tfidf_pairs = calculate_similarity_pairs(create_tfidf_embeddings(None, documents=documents))
+
+    runs = {}
+    for name in (baseline, backend):
+        get_model(model, backend=name)  # load outside the timed section
+        start = time.perf_counter()
+        embeddings = create_document_embeddings(documents, model, batch_size=batch_size, backend=name)
+        seconds = time.perf_counter() - start
+
+        pairs = calculate_similarity_pairs(embeddings)
+        if channel == "paraphrase":
+            composite = calculate_composite_pairs(other_pairs, tfidf_pairs, pairs)
+        else:
+            composite = calculate_composite_pairs(pairs, tfidf_pairs, other_pairs)
+        runs[name] = {"embeddings": embeddings, "seconds": seconds, "pairs": pairs, "composite": composite}
+
+    base, candidate = runs[baseline], runs[backend]
+    channel_drift = np.abs(candidate["pairs"].scores - base["pairs"].scores)
+    composite_drift = np.abs(candidate["composite"].scores - base["composite"].scores)
+    cosines = [float(np.dot(base["embeddings"][team].ravel(), candidate["embeddings"][team].ravel()))
+               for team in documents]
+
+    return {
+        "model": model,
+        "channel": channel,
+        "baseline": baseline,
+        "backend": resolve_backend(model, backend),
+        "documents": len(documents),
+        "pairs": len(base["pairs"]),
+        "baseline_seconds": round(base["seconds"], 3),
+        "backend_seconds": round(candidate["seconds"], 3),
+        "speedup": round(base["seconds"] / candidate["seconds"], 2) if candidate["seconds"] else None,
+        "min_document_cosine": round(min(cosines), 6) if cosines else None,
+        "max_channel_drift": float(channel_drift.max()) if len(channel_drift) else 0.0,
+        "mean_channel_drift": float(channel_drift.mean()) if len(channel_drift) else 0.0,
+        "max_composite_drift": float(composite_drift.max()) if len(composite_drift) else 0.0,
+        "threshold": threshold,
+        "channel_flips": _flips(base["pairs"], candidate["pairs"], threshold),
+        "composite_flips": _flips(base["composite"], candidate["composite"], threshold),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare an encoder backend with the PyTorch baseline.")
+    parser.add_argument("zip_file", help="ZIP of sample PDF reports.")
+    parser.add_argument("--backend", required=True, help="Backend to test: torch-int8 or onnx.")
+    parser.add_argument("--model", default=paraphrase_model)
+    parser.add_argument("--channel", choices=("paraphrase", "context"), default="paraphrase")
+    parser.add_argument("--sample", type=int, default=None, help="Use only the first N documents.")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes.")
+    parser.add_argument("--threshold", type=float, default=FLAG_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    from document_store import extract_documents_from_zip
+
+    documents = extract_documents_from_zip(args.zip_file, workers=args.workers).documents
+    if args.sample:
+        documents = dict(list(documents.items())[:args.sample])
+
+    report = compare_backends(documents, args.backend, model=args.model, channel=args.channel, threshold=args.threshold)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Reproducible benchmarks for the similarity pipeline.
+
+    python benchmark.py --sizes 10 100 1000 --workers 8
+
+For each cohort size a synthetic ZIP of multi-page PDF reports is generated
+offline (fixed seed), the full pipeline is run in a fresh Python process so peak
+memory is measured per size, and one JSON record per run is appended to the
+results file together with the current git commit. Models must already be in
+the local Hugging Face cache; the hub is never contacted.
+
+Planted overlap per cohort:
+- every report starts its pages with the same course template boilerplate,
+- copy_fraction of the reports copy two pages of another report verbatim,
+- paraphrase_fraction rewrite another report with synonym swaps and reordered
+  sentences.
+The planted pairs are stored as ground truth, and each run reports how many of
+them rank among the top composite scores.
+
+    python benchmark.py --sizes 1000 --truncate-dims 512 256 128
+
+compares the context channel truncated to each Matryoshka dimension with its
+full width instead (scoring time, matrix size, score drift, neighbour overlap).
+
+    python benchmark.py --sizes 1000 --store-dtypes float16 int8
+
+checks the cohort embedding store precisions (COHORT_VECTOR_DTYPE) against
+float32 on both transformer channels (size, score drift, neighbour overlap,
+flag-threshold flips); see embedding_store.check_precision.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+
+# Never reach out to the Hugging Face Hub; models must already be cached locally
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+RESULTS_FILE = "benchmark_results.jsonl"
+
+TEMPLATE = [
+    "Milestone 1: Identify the user requirements and write user stories for each type of user of the application.",
+    "Milestone 2: Create wireframes and a storyboard describing how a user moves through the application.",
+    "Milestone 3: Describe the scheduling of the project, the tools used for collaboration and the design of components.",
+    "Milestone 4: Document the API endpoints with their request and response formats using the OpenAPI specification.",
+    "Milestone 5: Write test cases for each API endpoint and report the inputs, expected outputs and actual outputs.",
+    "Milestone 6: Present the final implementation, the code review process and the issues tracked during development.",
+]
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "te", "su", "vin", "dor", "pel", "qua", "zen", "bri", "mon", "tal", "ex", "ul"]
+
+
+def _make_vocabulary(rng, size=4000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _sentence(rng, vocabulary, length):
+    words = [rng.choice(vocabulary) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng, vocabulary, sentences=6):
+    return " ".join(_sentence(rng, vocabulary, rng.randint(8, 16)) for _ in range(sentences))
+
+
+def _paraphrase(rng, paragraph, synonyms):
+    # Swap words for their "synonyms" and reorder the sentences
+    sentences = [s for s in paragraph.split(". ") if s]
+    rng.shuffle(sentences)
+    rewritten = []
+    for sentence in sentences:
+        words = [synonyms.get(word.lower().strip("."), word) for word in sentence.split()]
+        rewritten.append(" ".join(words).rstrip(".").capitalize() + ".")
+    return " ".join(rewritten)
+
+
+def _write_pdf(pages):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for page_text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), page_text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def generate_corpus(zip_path, n_docs, pages=4, seed=0, copy_fraction=0.1, paraphrase_fraction=0.1):
+    """
+    Write a ZIP of n_docs synthetic "Team NNNN.pdf" reports.
+
+    Returns:
+    - dict: {"copied": [[team_a, team_b], ...], "paraphrased": [...]}, the planted pairs.
+    """
+    rng = random.Random(seed)
+    vocabulary = _make_vocabulary(rng)
+    synonyms = {word: rng.choice(vocabulary) for word in rng.sample(vocabulary, len(vocabulary) // 3)}
+    teams = [f"{i:04d}" for i in range(n_docs)]
+
+    bodies = {team: [[_paragraph(rng, vocabulary) for _ in range(3)] for _ in range(pages)] for team in teams}
+    ground_truth = {"copied": [], "paraphrased": []}
+
+    shuffled = teams[:]
+    rng.shuffle(shuffled)
+    n_copied = int(n_docs * copy_fraction)
+    n_paraphrased = int(n_docs * paraphrase_fraction)
+    for i in range(n_copied + n_paraphrased):
+        if 2 * i + 1 >= len(shuffled):
+            break
+        source, target = shuffled[2 * i], shuffled[2 * i + 1]
+        if i < n_copied:
+            for page in rng.sample(range(pages), min(2, pages)):
+                bodies[target][page] = list(bodies[source][page])
+            ground_truth["copied"].append([source, target])
+        else:
+            bodies[target] = [[_paraphrase(rng, p, synonyms) for p in page] for page in bodies[source]]
+            ground_truth["paraphrased"].append([source, target])
+
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zip_ref:
+        for team in teams:
+            page_texts = [
+                "\n\n".join([TEMPLATE[page % len(TEMPLATE)]] + bodies[team][page])
+                for page in range(pages)
+            ]
+            zip_ref.writestr(f"Team {team}.pdf", _write_pdf(page_texts))
+
+    return ground_truth
+
+
+def _planted_recall(composite_pairs, ground_truth):
+    # Share of planted pairs found among the len(planted) highest composite scores
+    planted = {frozenset(pair) for kind in ground_truth.values() for pair in kind}
+    if not planted:
+        return None
+    order = composite_pairs.scores.argsort()[::-1][:len(planted)]
+    found = {
+        frozenset((composite_pairs.teams[composite_pairs.rows[i]], composite_pairs.teams[composite_pairs.cols[i]]))
+        for i in order
+    }
+    return round(len(planted & found) / len(planted), 4)
+
+
+def run_once(zip_path, ground_truth_path, workers, use_cache, options=None):
+    """
+    Run the pipeline once on a generated corpus and return the benchmark record.
+
+    options are passed on to pipeline.run_analysis, e.g. {"cascade_top_k": 200}.
+    """
+    options = options or {}
+    from embedding_cache import EmbeddingCache
+    from pipeline import analyse_zip
+    from profiling import Profiler, peak_rss_mb
+
+    with open(ground_truth_path) as f:
+        ground_truth = json.load(f)
+
+    cache = None
+    if use_cache:
+        cache = EmbeddingCache(os.path.join(os.path.dirname(zip_path), "embedding_cache"))
+
+    profiler = Profiler()
+    start = time.perf_counter()
+    result = analyse_zip(zip_path, workers=workers, profiler=profiler, cache=cache, **options)
+    wall_seconds = time.perf_counter() - start
+
+    n_docs = len(result.corpus)
+    return {
+        "documents": n_docs,
+        "pairs": len(result.composite_pairs),
+        "workers": workers,
+        "cache": use_cache,
+        "options": options,
+        "wall_seconds": round(wall_seconds, 3),
+        "documents_per_second": round(n_docs / wall_seconds, 3) if wall_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "planted_pair_recall": _planted_recall(result.composite_pairs, ground_truth),
+        "stages": profiler.stages,
+    }
+
+
+def run_truncation(zip_path, ground_truth_path, workers, dims, k=10):
+    """
+    Speed/accuracy trade-off of truncating the Matryoshka context embeddings.
+
+    Each dimension is compared with the full-width context channel on the same
+    corpus: encoding and all-pairs scoring time, matrix size, pair score drift,
+    top-k neighbour overlap, flag-threshold flips and planted-pair recall.
+    """
+    from calculate_similarity import calculate_similarity_pairs
+    from create_embeddings import create_document_embeddings
+    from document_store import extract_documents_from_zip
+    from passage_match import FLAG_THRESHOLD
+    from pipeline import embed_model
+    from similarity_engine import NeighbourIndex, stack_embeddings
+
+    with open(ground_truth_path) as f:
+        ground_truth = json.load(f)
+    documents = extract_documents_from_zip(zip_path, workers=workers).documents
+
+    records = []
+    reference = None
+    for dim in [None] + sorted(dims, reverse=True):
+        start = time.perf_counter()
+        embeddings = create_document_embeddings(documents, embed_model, truncate_dim=dim)
+        encode_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        pairs = calculate_similarity_pairs(embeddings)
+        scoring_seconds = time.perf_counter() - start
+
+        _, matrix = stack_embeddings(embeddings)
+        neighbour_count = min(k, len(documents) - 1)
+        neighbours, _ = NeighbourIndex(matrix).search(matrix, k=neighbour_count, exclude_self=True)
+        if reference is None:
+            reference = {"pairs": pairs, "neighbours": neighbours}
+
+        error = np.abs(pairs.scores - reference["pairs"].scores)
+        overlap = [len(set(a) & set(b)) / neighbour_count for a, b in zip(neighbours, reference["neighbours"])] if neighbour_count else []
+        records.append({
+            "dim": int(matrix.shape[1]),
+            "encode_seconds": round(encode_seconds, 3),
+            "scoring_seconds": round(scoring_seconds, 4),
+            "matrix_bytes": int(matrix.nbytes),
+            "max_abs_error": float(error.max()) if len(error) else 0.0,
+            "mean_abs_error": float(error.mean()) if len(error) else 0.0,
+            "topk_overlap": float(np.mean(overlap)) if overlap else None,
+            "threshold_flips": int(np.sum((pairs.scores >= FLAG_THRESHOLD) != (reference["pairs"].scores >= FLAG_THRESHOLD))),
+            "planted_pair_recall": _planted_recall(pairs, ground_truth),
+        })
+    return {"documents": len(documents), "workers": workers, "truncation": records}
+
+
+def run_precision(zip_path, workers, dtypes, k=10):
+    """
+    Accuracy of storing the context and paraphrase vectors at reduced precision,
+    per channel, from embedding_store.check_precision on this corpus's vectors.
+    """
+    from create_embeddings import create_document_embeddings
+    from document_store import extract_documents_from_zip
+    from embedding_store import check_precision
+    from passage_match import FLAG_THRESHOLD
+    from pipeline import embed_model, paraphrase_model
+    from similarity_engine import stack_embeddings
+
+    documents = extract_documents_from_zip(zip_path, workers=workers).documents
+    channels = {}
+    for channel, model in (("context", embed_model), ("paraphrase", paraphrase_model)):
+        teams, matrix = stack_embeddings(create_document_embeddings(documents, model))
+        channels[channel] = check_precision(teams, matrix, dtypes=dtypes, k=k, threshold=FLAG_THRESHOLD)
+    return {"documents": len(documents), "workers": workers, "precision": channels}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the similarity pipeline on synthetic cohorts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Cohort sizes to run.")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per synthetic report.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Use an embedding cache (warm runs).")
+    parser.add_argument("--truncate-dims", type=int, nargs="+", default=None,
+                        help="Instead of the full pipeline, compare the context channel at these Matryoshka "
+                             "dimensions with its full width.")
+    parser.add_argument("--store-dtypes", nargs="+", default=None, choices=("float32", "float16", "int8"),
+                        help="Instead of the full pipeline, compare these embedding store precisions with float32.")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="Pipeline option, e.g. cascade_top_k=200 (value parsed as JSON). Repeatable.")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON-lines file the records are appended to.")
+    parser.add_argument("--run-once", nargs=2, metavar=("ZIP", "GROUND_TRUTH"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    options = {}
+    for option in args.option:
+        name, _, value = option.partition("=")
+        options[name] = json.loads(value)
+
+    if args.run_once:
+        # Child process: one measurement, printed as JSON on the last line
+        if args.truncate_dims:
+            record = run_truncation(args.run_once[0], args.run_once[1], args.workers, args.truncate_dims)
+        elif args.store_dtypes:
+            record = run_precision(args.run_once[0], args.workers, args.store_dtypes)
+        else:
+            record = run_once(args.run_once[0], args.run_once[1], args.workers, args.cache, options)
+        print(json.dumps(record))
+        return
+
+    commit = _git_commit()
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            zip_path = os.path.join(work_dir, f"cohort_{size}.zip")
+            ground_truth_path = os.path.join(work_dir, f"cohort_{size}.json")
+            generation_start = time.perf_counter()
+            ground_truth = generate_corpus(zip_path, size, pages=args.pages, seed=args.seed)
+            generation_seconds = time.perf_counter() - generation_start
+            with open(ground_truth_path, "w") as f:
+                json.dump(ground_truth, f)
+
+            command = [sys.executable, os.path.abspath(__file__), "--workers", str(args.workers),
+                       "--run-once", zip_path, ground_truth_path]
+            if args.cache:
+                command.append("--cache")
+            for option in args.option:
+                command += ["--option", option]
+            if args.truncate_dims:
+                command += ["--truncate-dims"] + [str(dim) for dim in args.truncate_dims]
+            if args.store_dtypes:
+                command += ["--store-dtypes"] + args.store_dtypes
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                raise SystemExit(f"Benchmark run for {size} documents failed")
+
+            record = json.loads(completed.stdout.strip().splitlines()[-1])
+            record.update({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": commit,
+                "cohort_size": size,
+                "pages": args.pages,
+                "seed": args.seed,
+                "generation_seconds": round(generation_seconds, 3),
+            })
+            with open(args.output, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+            if args.truncate_dims:
+                for row in record["truncation"]:
+                    print(f"{size:>6} docs  dim {row['dim']:>5}  scoring {row['scoring_seconds']:>8.4f} s  "
+                          f"{row['matrix_bytes'] / 2**20:>8.2f} MB  max err {row['max_abs_error']:.4f}  "
+                          f"top-k {row['topk_overlap']}  flips {row['threshold_flips']}  recall {row['planted_pair_recall']}")
+                continue
+            if args.store_dtypes:
+                for channel, report in record["precision"].items():
+                    for dtype, row in report.items():
+                        print(f"{size:>6} docs  {channel:<10} {dtype:<7} {row['bytes'] / 2**20:>8.2f} MB  "
+                              f"max err {row['max_abs_error']:.4f}  top-k {row['topk_overlap']}  "
+                              f"flips {row['threshold_flips']}")
+                continue
+
+            print(f"{size:>6} docs  {record['wall_seconds']:>9.2f} s  {record['documents_per_second']:>8.2f} docs/s  "
+                  f"peak {record['peak_rss_mb']} MB  recall {record['planted_pair_recall']}")
+            for stage in record["stages"]:
+                print(f"         {stage['stage']:<36} {stage['wall_seconds']:>9.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import hashlib
+import re
+from collections import Counter
+from document_store import ExtractedDocument
+
+_WORD = re.compile(r"\w+")
+
+
+def line_fingerprint(line):
+    """
+    Hash of a line's lower-cased words, so case, punctuation and spacing
+    differences between PDFs do not hide a shared template line. Lines without
+    words get None.
+    """
+    words = _WORD.findall(line.lower())
+    if not words:
+        return None
+    return hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def find_boilerplate(documents, max_fraction=0.5, min_documents=3):
+    """
+    Fingerprints of text lines that occur in too many documents to be evidence of copying.
+
+    Lines rather than whole chunks are compared: extracted PDF text has no
+    paragraph breaks, so a template heading usually shares its chunk with the
+    team's own text and chunk boundaries differ from report to report.
+
+    Parameters:
+    - documents (dict): {team_name: ExtractedDocument}
+    - max_fraction (float): A line is boilerplate if it occurs in more than this
+      fraction of the documents...
+    - min_documents (int): ...and in at least this many, so small cohorts do not
+      lose genuinely shared passages.
+
+    Returns:
+    - dict: {fingerprint: document count} of the boilerplate lines.
+    """
+    document_frequency = Counter()
+    for document in documents.values():
+        fingerprints = {line_fingerprint(line) for page in document.pages for line in page.split("\n")}
+        fingerprints.discard(None)
+        document_frequency.update(fingerprints)
+
+    cutoff = max_fraction * len(documents)
+    return {fingerprint: count for fingerprint, count in document_frequency.items()
+            if count > cutoff and count >= min_documents}
+
+
+def _strip_chunk(chunk, boilerplate):
+    # The chunk without its boilerplate lines, and the fingerprints it lost
+    kept, dropped = [], []
+    for line in chunk.split("\n"):
+        fingerprint = line_fingerprint(line)
+        if fingerprint is not None and fingerprint in boilerplate:
+            dropped.append(fingerprint)
+        else:
+            kept.append(line)
+    return "\n".join(kept), dropped
+
+
+def remove_boilerplate(documents, boilerplate):
+    """
+    Copies of the documents with boilerplate lines cut out of their chunks, for the encoders.
+
+    Chunks left without any words are dropped. Pages are untouched, so TF-IDF,
+    MinHash and the report still see the full text. Each filtered document
+    records what was removed in its variant, so its cached embeddings never mix
+    with unfiltered ones.
+
+    Returns:
+    - dict: {team_name: ExtractedDocument}, in the order of documents.
+    """
+    filtered = {}
+    for team_name, document in documents.items():
+        chunks, chunk_pages, chunk_offsets, removed = [], [], [], []
+        for chunk, page, offset in zip(document.chunks, document.chunk_pages, document.chunk_offsets):
+            text, dropped = _strip_chunk(chunk, boilerplate)
+            removed.extend(dropped)
+            if _WORD.search(text):
+                chunks.append(text)
+                chunk_pages.append(page)
+                chunk_offsets.append(offset)
+
+        if not removed:
+            filtered[team_name] = document
+            continue
+
+        variant = "boilerplate=" + hashlib.sha256(",".join(removed).encode("utf-8")).hexdigest()[:16]
+        copy = ExtractedDocument(document.team_name, document.path, document.pages, chunks,
+                                 content_hash=document.content_hash,
+                                 chunk_size=document.chunk_size, chunk_overlap=document.chunk_overlap,
+                                 chunk_pages=chunk_pages, chunk_offsets=chunk_offsets, variant=variant)
+        copy.stats = dict(document.stats, boilerplate_lines=len(removed),
+                          boilerplate_chunks=len(document.chunks) - len(chunks))
+        filtered[team_name] = copy
+    return filtered
@@ -1,70 +1,144 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from minhash import DEFAULT_MAX_BUCKET_FRACTION, build_minhash_index
+from similarity_engine import PairScores, all_pairs_similarity, candidate_pairs, composite_scores, pair_key, score_pairs, stack_embeddings
+
+
+def calculate_similarity_pairs(embeddings_dict, block_size=1024):
+    """
+    All-pairs cosine similarity of {team_name: 1 x d vector} as a PairScores.
+
+    Works for dense transformer embeddings and sparse TF-IDF rows alike.
+    """
+    teams, matrix = stack_embeddings(embeddings_dict)
+    return all_pairs_similarity(teams, matrix, block_size=block_size)
+
+def find_candidate_pairs(embeddings_dict, top_k=10, threshold=None, block_size=1024):
+    """
+    Candidate pairs from each team's top_k nearest neighbours (exact blocked search),
+    optionally limited to scores >= threshold. Use on a cheap channel, then score
+    the other channels with calculate_similarity_for_pairs on these pairs only.
+    """
+    teams, matrix = stack_embeddings(embeddings_dict)
+    return candidate_pairs(teams, matrix, k=top_k, threshold=threshold, block_size=block_size)
+
+def find_near_duplicate_pairs(documents, num_perm=128, bands=32, shingle_size=5, max_bucket_fraction=DEFAULT_MAX_BUCKET_FRACTION):
+    """
+    Near-duplicate candidate pairs of {team_name: ExtractedDocument} from MinHash
+    LSH over word shingles, scored with the estimated Jaccard similarity.
+    max_bucket_fraction bounds the LSH buckets used relative to the number of
+    documents; see MinHashIndex.candidate_pairs.
+
+    Returns:
+    - (PairScores, MinHashIndex); the index can score further pairs.
+    """
+    index = build_minhash_index(documents, num_perm=num_perm, bands=bands, shingle_size=shingle_size)
+    return index.candidate_pairs(max_fraction=max_bucket_fraction), index
+
+def calculate_similarity_for_pairs(embeddings_dict, candidates):
+    teams, matrix = stack_embeddings(embeddings_dict)
+    return score_pairs(teams, matrix, candidates)
+
 def calculate_similarity(embeddings_dict, embed_model='sentence-transformers/static-similarity-mrl-multilingual-v1'):
-    model = SentenceTransformer(embed_model)
-    similarity_dict = {}
-
-    for current_team in embeddings_dict:
-        for other_team in embeddings_dict:
-            if current_team != other_team:
-                team_string = f"Team {current_team} and Team {other_team}"
-                if team_string not in similarity_dict and f"Team {other_team} and Team {current_team}" not in similarity_dict:
-                    if len(embeddings_dict[current_team].shape) == 1:
-                        embeddings_dict[current_team] = embeddings_dict[current_team].unsqueeze(0)
-                    if len(embeddings_dict[other_team].shape) == 1:
-                        embeddings_dict[other_team] = embeddings_dict[other_team].unsqueeze(0)
-                    try:
-                        similarity = model.similarity(embeddings_dict[current_team], embeddings_dict[other_team])
-                        similarity_dict[team_string] = round(float(similarity[0]), 2)
-                    except:
-                        similarity = -1.00000
-                        similarity_dict[team_string] = round(float(similarity), 2)
-                    
-
-    return similarity_dict
+    # model.similarity for these models is cosine similarity, so no model is needed
+    return calculate_similarity_pairs(embeddings_dict).to_dict()
+
 def calculate_tfidf_similarity(tfidf_embeddings_dict):
-    similarity_dict = {}
+    return calculate_similarity_pairs(tfidf_embeddings_dict).to_dict()
+
 
-    for current_team in tfidf_embeddings_dict:
-        for other_team in tfidf_embeddings_dict:
-            if current_team != other_team:
-                team_string = f"Team {current_team} and Team {other_team}"
-                if team_string not in similarity_dict and f"Team {other_team} and Team {current_team}" not in similarity_dict:
-                    similarity = np.dot(tfidf_embeddings_dict[current_team], tfidf_embeddings_dict[other_team].T)
-                    similarity_dict[team_string] = round(float(similarity[0][0]), 2)
+def calculate_similarity_paraphrase(embeddings_dict, embed_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
+    return calculate_similarity_pairs(embeddings_dict).to_dict()
 
-    return similarity_dict
+# Channel weights of the composite score, as described in the report methodology
+DEFAULT_WEIGHTS = {"context": 0.4, "paraphrase": 0.4, "tfidf": 0.2}
 
+def composite_weights(minhash_weight=0.0):
+    """
+    Composite channel weights, summing to one.
 
-def calculate_similarity_paraphrase(embeddings_dict, embed_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
-    model = SentenceTransformer(embed_model)
-    similarity_dict = {}
+    A MinHash weight takes its share from the other three channels, which keep
+    their relative proportions: minhash_weight=0.2 gives context and paraphrase
+    0.32 each and TF-IDF 0.16.
+    """
+    if not 0 <= minhash_weight < 1:
+        raise ValueError(f"minhash_weight must be in [0, 1), got {minhash_weight}")
+    if minhash_weight == 0:
+        return dict(DEFAULT_WEIGHTS)
+    weights = {name: weight * (1 - minhash_weight) for name, weight in DEFAULT_WEIGHTS.items()}
+    weights["minhash"] = minhash_weight
+    return weights
+
+def calculate_composite_pairs(context_aware_pairs, tfidf_pairs, paraphrase_pairs, weights=None, minhash_pairs=None):
+    """
+    Composite PairScores from the three channels' PairScores.
+
+    Pairs are aligned by team names, so channels may cover different documents;
+    see similarity_engine.composite_scores for how missing scores are handled.
+    minhash_pairs (MinHash Jaccard estimates) only count if weights has a
+    "minhash" entry.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+
+    channel_pairs = {"context": context_aware_pairs, "tfidf": tfidf_pairs, "paraphrase": paraphrase_pairs}
+    if minhash_pairs is not None:
+        channel_pairs["minhash"] = minhash_pairs
+    return composite_scores(channel_pairs, weights)
+
+def select_cascade_pairs(context_aware_pairs, tfidf_pairs, threshold=None, top_k=0, weights=None):
+    """
+    Pairs worth sending to the expensive paraphrase channel in cascade mode.
 
-    for current_team in embeddings_dict:
-        for other_team in embeddings_dict:
-            if current_team != other_team:
-                team_string = f"Team {current_team} and Team {other_team}"
-                if team_string not in similarity_dict and f"Team {other_team} and Team {current_team}" not in similarity_dict:
-                    try:
-                        similarity = model.similarity(embeddings_dict[current_team], embeddings_dict[other_team])
-                        similarity_dict[team_string] = round(float(similarity[0]), 2)
-                    except:
-                        similarity = -1.00000
-                        similarity_dict[team_string] = round(float(similarity), 2)
+    The cheap score blends the context and TF-IDF channels with their composite
+    weights renormalised over those two. A pair is kept if its cheap score is at
+    least threshold or it is among the top_k cheap scores overall.
 
-    return similarity_dict
+    Returns:
+    - PairScores of the kept pairs, scored with the cheap blend.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
 
-def calculate_composite_similarity(context_aware_embeddings, tfidf_embeddings,paraphrase_sim, alpha=0.5):
-    composite_similarity_dict = {}
+    cheap = composite_scores({"context": context_aware_pairs, "tfidf": tfidf_pairs}, weights)
+    scores = np.nan_to_num(cheap.scores.astype(np.float64), nan=-np.inf)
+    keep = np.zeros(len(scores), dtype=bool)
+    if threshold is not None:
+        keep |= scores >= threshold
+    top_k = min(top_k, len(scores))
+    if top_k > 0:
+        keep[np.argpartition(-scores, top_k - 1)[:top_k]] = True
+    return PairScores(cheap.teams, cheap.rows[keep], cheap.cols[keep], cheap.scores[keep])
 
-    tfidf_sim = np.array(list(tfidf_embeddings.values()))
-    embed_sim = np.array(list(context_aware_embeddings.values()))
-    paraphrased_sim = np.array(list(paraphrase_sim.values()))
+def calculate_composite_similarity(context_aware_embeddings, tfidf_embeddings,paraphrase_sim, alpha=0.5, weights=None):
+    # Dict variant: align the three channels on the unordered team pair instead of
+    # relying on identical insertion order or label spelling ("Team A and Team B"
+    # and "Team B and Team A" are the same pair). A pair missing from a channel
+    # (e.g. screened out of the paraphrase channel in cascade mode) is blended from
+    # the channels that scored it, with their weights renormalised, as in
+    # calculate_composite_pairs. Each pair keeps the first label it was seen with.
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
 
-    linear_comb = 0.2 * tfidf_sim + 0.4 * embed_sim + 0.4 * paraphrased_sim
+    channels = (("context", context_aware_embeddings), ("tfidf", tfidf_embeddings), ("paraphrase", paraphrase_sim))
+    labels = {}
+    for _, channel in channels:
+        for label in channel:
+            labels.setdefault(pair_key(label), label)
+    keys = list(labels.keys())
+    position = {key: i for i, key in enumerate(keys)}
 
-    for i in range(len(linear_comb)):
-        composite_similarity_dict[list(context_aware_embeddings.keys())[i]] = linear_comb[i]
+    weighted_sum = np.zeros(len(keys))
+    weight_total = np.zeros(len(keys))
+    for name, channel in channels:
+        weight = weights.get(name, 0.0)
+        for label, value in channel.items():
+            if value is None or np.isnan(value):
+                continue
+            i = position[pair_key(label)]
+            weighted_sum[i] += weight * value
+            weight_total[i] += weight
 
+    with np.errstate(invalid="ignore", divide="ignore"):
+        linear_comb = np.where(weight_total > 0, weighted_sum / weight_total, np.nan)
 
-    return composite_similarity_dict
+    return {labels[key]: score for key, score in zip(keys, linear_comb)}
@@ -0,0 +1,273 @@
+"""
+Headless similarity audits, e.g. from cron. Never imports Streamlit.
+
+    python cli.py section_a.zip section_b.zip reports_dir/ --output-dir audits/ --workers 8
+
+Each input (a ZIP of team reports or a directory of PDFs) is analysed on its own
+and written to <output-dir>/<input name>/:
+- similarity_report.pdf: the same report the app offers for download,
+- scores.npz: team names, the scored pairs (rows, cols index into teams) and
+  one float32 score array per channel and the composite (NaN where a channel did
+  not score the pair); square <name>_matrix arrays are added only if every pair
+  was scored, i.e. not in candidate runs,
+- scores.csv: one row per scored pair with every channel and the composite,
+- flagged_pairs.json: pairs whose composite score reaches the flag threshold,
+- profile.json: per-stage and per-document timings.
+
+In cascade mode scores.npz ("screened"), scores.csv, flagged_pairs.json and the
+PDF table mark the pairs screened out of the paraphrase channel: their composite
+blends context and TF-IDF only, so it is not on the same scale as the others.
+
+Heavy modules (PyMuPDF, scikit-learn, torch) are imported only after the
+arguments are parsed, so --help and argument errors return immediately.
+The exit status is 1 if any input failed.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+import model_registry
+
+FORMATS = ("npz", "csv", "json")
+
+
+def _positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run headless similarity audits on ZIPs or directories of team reports.")
+    parser.add_argument("inputs", nargs="+", help="ZIP files or directories of PDF reports.")
+    parser.add_argument("--output-dir", default="audits", help="Results go to <output-dir>/<input name>/.")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="Machine-readable outputs to write next to the PDF.")
+    parser.add_argument("--no-pdf", action="store_true", help="Skip the PDF report.")
+
+    workers = parser.add_argument_group("parallelism")
+    workers.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes.")
+    workers.add_argument("--encoder-threads", type=int, default=None, help="Intra-op threads of the encoders.")
+    workers.add_argument("--scoring-threads", type=int, default=None,
+                         help="BLAS threads for the similarity matrix products.")
+
+    analysis = parser.add_argument_group("analysis (see pipeline.run_analysis)")
+    analysis.add_argument("--cohort", default=None, help="Merge into this persisted cohort.")
+    analysis.add_argument("--candidate-top-k", type=int, default=0)
+    analysis.add_argument("--minhash-weight", type=float, default=0.0)
+    analysis.add_argument("--minhash-max-bucket-fraction", type=float, default=None,
+                          help="Skip LSH buckets shared by more than this fraction of the reports (template "
+                               "text); default minhash.DEFAULT_MAX_BUCKET_FRACTION, 1 keeps all.")
+    analysis.add_argument("--cascade-threshold", type=float, default=None)
+    analysis.add_argument("--cascade-top-k", type=int, default=0)
+    analysis.add_argument("--boilerplate-fraction", type=float, default=None)
+    analysis.add_argument("--context-dim", type=_positive_int, default=None)
+    analysis.add_argument("--backend", default=None, choices=model_registry.BACKENDS, help="Encoder backend.")
+    analysis.add_argument("--cache-dir", default=None, help="Embedding cache directory (default EMBEDDING_CACHE_DIR).")
+    analysis.add_argument("--no-cache", action="store_true", help="Do not read or write the embedding cache.")
+    args = parser.parse_args(argv)
+
+    if args.cohort:
+        # A cohort always scores all pairs with the default channels
+        unsupported = [flag for flag, used in (
+            ("--candidate-top-k", args.candidate_top_k > 0),
+            ("--minhash-weight", args.minhash_weight > 0),
+            ("--minhash-max-bucket-fraction", args.minhash_max_bucket_fraction is not None),
+            ("--cascade-threshold", args.cascade_threshold is not None),
+            ("--cascade-top-k", args.cascade_top_k > 0),
+            ("--boilerplate-fraction", args.boilerplate_fraction is not None),
+        ) if used]
+        if unsupported:
+            parser.error(f"not supported with --cohort: {', '.join(unsupported)}")
+    return args
+
+
+def _configure_threads(args):
+    # Must run before numpy / torch are imported: both read these at import time
+    if args.scoring_threads:
+        for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[variable] = str(args.scoring_threads)
+    # model_registry was imported for the --backend choices and has already read
+    # ENCODER_THREADS / ENCODER_BACKEND, so set its settings directly
+    if args.encoder_threads:
+        model_registry.ENCODER_THREADS = args.encoder_threads
+    if args.backend:
+        model_registry.DEFAULT_BACKEND = args.backend
+
+
+def _output_name(path):
+    name = os.path.basename(os.path.normpath(path))
+    return name[:-4] if name.lower().endswith(".zip") else name
+
+
+def score_table(result):
+    """
+    Every channel's scores at the composite's pairs.
+
+    Returns:
+    - (teams, rows, cols, {name: float32 array}): rows and cols index into teams
+      (rows < cols); one score array per channel plus "composite", NaN where a
+      channel did not score the pair.
+    """
+    from similarity_engine import aligned_scores
+
+    composite = result.composite_pairs
+    scores = {name: aligned_scores(pairs, composite) for name, pairs in result.channel_pairs.items()}
+    scores["composite"] = composite.scores
+    return composite.teams, composite.rows, composite.cols, scores
+
+
+def square_matrix(n, rows, cols, scores):
+    # Symmetric n x n matrix of a complete pair list, diagonal 1
+    import numpy as np
+
+    matrix = np.full((n, n), np.nan, dtype=np.float32)
+    np.fill_diagonal(matrix, 1.0)
+    matrix[rows, cols] = scores
+    matrix[cols, rows] = scores
+    return matrix
+
+
+def _write_csv(path, teams, rows, cols, scores, screened=None, block_size=100_000):
+    # Formatted and written a block of pairs at a time, without a per-pair Python
+    # loop; a final "screened" column (1/0) is added in cascade mode
+    import numpy as np
+
+    names = np.array(teams, dtype=object)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["team_a", "team_b"] + list(scores.keys()) + (["screened"] if screened is not None else []))
+        for start in range(0, len(rows), block_size):
+            stop = start + block_size
+            columns = [names[rows[start:stop]].tolist(), names[cols[start:stop]].tolist()]
+            for values in scores.values():
+                block = values[start:stop]
+                formatted = np.char.mod("%.4f", block).astype(object)
+                formatted[np.isnan(block)] = ""
+                columns.append(formatted.tolist())
+            if screened is not None:
+                columns.append(screened[start:stop].astype(np.int8).tolist())
+            writer.writerows(zip(*columns))
+
+
+def write_outputs(result, output_dir, formats, threshold):
+    import numpy as np
+    from create_report import export_flagged_pairs
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    if result.report is not None:
+        path = os.path.join(output_dir, "similarity_report.pdf")
+        with open(path, "wb") as f:
+            f.write(result.report)
+        written.append(path)
+
+    teams, rows, cols, scores = score_table(result)
+    if "npz" in formats:
+        path = os.path.join(output_dir, "scores.npz")
+        arrays = dict(scores)
+        # Square matrices only when every pair was scored; candidate runs on large
+        # cohorts would otherwise need n x n floats per channel
+        n = len(teams)
+        if n > 1 and len(rows) == n * (n - 1) // 2:
+            for name, values in scores.items():
+                arrays[f"{name}_matrix"] = square_matrix(n, rows, cols, values)
+        if result.screened_pairs is not None:
+            arrays["screened"] = result.screened_pairs
+        np.savez_compressed(path, teams=np.array(teams), rows=rows, cols=cols, **arrays)
+        written.append(path)
+
+    if "csv" in formats:
+        path = os.path.join(output_dir, "scores.csv")
+        _write_csv(path, teams, rows, cols, scores, screened=result.screened_pairs)
+        written.append(path)
+
+    if "json" in formats:
+        path = os.path.join(output_dir, "flagged_pairs.json")
+        with open(path, "wb") as f:
+            f.write(export_flagged_pairs(result.composite_pairs, threshold=threshold, fmt="json",
+                                         screened=result.screened_pairs))
+        written.append(path)
+
+    path = os.path.join(output_dir, "profile.json")
+    result.profiler.to_json(path)
+    written.append(path)
+    return written
+
+
+def run_audit(input_path, args, cache):
+    from minhash import DEFAULT_MAX_BUCKET_FRACTION
+    from passage_match import FLAG_THRESHOLD
+    from pipeline import analyse_directory, analyse_zip
+
+    options = dict(
+        cache=cache,
+        context_dim=args.context_dim,
+        cohort_name=args.cohort,
+        render_report=not args.no_pdf,
+    )
+    if not args.cohort:
+        options.update(
+            candidate_top_k=args.candidate_top_k,
+            minhash_weight=args.minhash_weight,
+            minhash_max_bucket_fraction=(DEFAULT_MAX_BUCKET_FRACTION if args.minhash_max_bucket_fraction is None
+                                         else args.minhash_max_bucket_fraction),
+            cascade_threshold=args.cascade_threshold,
+            cascade_top_k=args.cascade_top_k,
+            boilerplate_fraction=args.boilerplate_fraction,
+        )
+    if os.path.isdir(input_path):
+        result = analyse_directory(input_path, workers=args.workers, **options)
+    else:
+        result = analyse_zip(input_path, workers=args.workers, source=input_path, **options)
+
+    output_dir = os.path.join(args.output_dir, _output_name(input_path))
+    written = write_outputs(result, output_dir, args.formats, FLAG_THRESHOLD)
+    flagged = int((result.composite_pairs.scores >= FLAG_THRESHOLD).sum())
+    if result.unmatched_pairs:
+        print(f"  no passages for {len(result.unmatched_pairs)} flagged pairs with reports from earlier cohort uploads")
+    print(f"  {len(result.corpus)} documents, {len(result.composite_pairs)} pairs, {flagged} flagged -> {output_dir}")
+    return written
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    _configure_threads(args)
+    # Skipped and renamed files are logged as warnings by document_store, run
+    # summaries at INFO by pipeline; other libraries stay at WARNING
+    logging.basicConfig(level=logging.WARNING, format="  %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("pipeline").setLevel(logging.INFO)
+
+    from embedding_cache import EmbeddingCache
+
+    cache = None
+    if not args.no_cache:
+        cache = EmbeddingCache(args.cache_dir) if args.cache_dir else EmbeddingCache()
+
+    failed = []
+    for input_path in args.inputs:
+        start = time.perf_counter()
+        print(f"Auditing {input_path}")
+        if not os.path.exists(input_path):
+            print("  not found")
+            failed.append(input_path)
+            continue
+        try:
+            run_audit(input_path, args, cache)
+        except Exception as e:
+            print(f"  failed: {type(e).__name__}: {e}")
+            failed.append(input_path)
+        print(f"  {time.perf_counter() - start:.1f}s")
+
+    summary = {"inputs": len(args.inputs), "failed": failed}
+    print(json.dumps(summary))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
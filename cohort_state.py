@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+import numpy as np
+from scipy.sparse import issparse, load_npz, save_npz, vstack as sparse_vstack
+from create_embeddings import create_document_embeddings
+from embedding_store import EmbeddingStore
+from model_registry import resolve_backend
+from similarity_engine import pairs_from_matrix, similarity_rows
+from tfidf_embed import count_terms, tfidf_from_counts
+
+# Override with COHORT_DIR; one sub-directory per cohort
+DEFAULT_COHORT_DIR = os.environ.get("COHORT_DIR", "cohorts")
+# Precision of the stored context/paraphrase vectors: float32, float16 or int8
+# (see embedding_store.check_precision for the effect on scores)
+DEFAULT_VECTOR_DTYPE = os.environ.get("COHORT_VECTOR_DTYPE", "float32")
+
+CHANNELS = ("context", "paraphrase", "tfidf")
+# Names the sub-directory holding a cohort's current files (see CohortState.save)
+CURRENT_FILE = "CURRENT"
+
+_cohort_locks = {}
+_cohort_locks_lock = threading.Lock()
+
+
+def cohort_lock(state_dir):
+    # Serialises load/update/save of one cohort between concurrent analyses
+    with _cohort_locks_lock:
+        return _cohort_locks.setdefault(os.path.abspath(state_dir), threading.Lock())
+
+
+def cohort_path(cohort_name, cohort_dir=DEFAULT_COHORT_DIR):
+    # Keep user-supplied names from escaping the cohort directory
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", cohort_name).strip("._") or "default"
+    return os.path.join(cohort_dir, safe_name)
+
+
+def current_dir(state_dir):
+    # Directory with the cohort's current files; cohorts saved before versioned
+    # directories keep them in state_dir itself
+    try:
+        with open(os.path.join(state_dir, CURRENT_FILE)) as f:
+            return os.path.join(state_dir, f.read().strip())
+    except FileNotFoundError:
+        return state_dir
+
+
+def cohort_version(cohort_name, cohort_dir=DEFAULT_COHORT_DIR):
+    """
+    Fingerprint of a cohort's saved state (its teams, their content hashes and
+    settings), or None if it has none yet. Changes whenever an upload adds or
+    changes a submission, so results computed before that are not reused.
+    """
+    try:
+        with open(os.path.join(current_dir(cohort_path(cohort_name, cohort_dir)), "state.json"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _merge_rows(old, new, n_total, updated_rows):
+    # Rows of old (first len(old) positions) with updated_rows replaced or appended
+    # from new, in order. Works for dense arrays and sparse matrices alike.
+    n_old = 0 if old is None else old.shape[0]
+    selector = np.arange(n_total)
+    selector[updated_rows] = n_old + np.arange(len(updated_rows))
+
+    if old is None or n_old == 0:
+        stacked = new
+    elif issparse(new):
+        stacked = sparse_vstack([old, new]).tocsr()
+    else:
+        stacked = np.vstack([old, new])
+    return stacked[selector]
+
+
+class CohortState:
+    """
+    Persisted analysis state of a cohort that grows over several uploads.
+
+    Stores, per document, its content fingerprint, the context and paraphrase
+    vectors and its raw term counts, plus each channel's square pairwise score
+    matrix. Files: state.json, vectors_context/ and vectors_paraphrase/
+    (memory-mapped EmbeddingStores in vector_dtype precision), term_counts.npz,
+    tfidf_vocabulary.json, scores.npz. They live in a sub-directory of state_dir
+    named by state_dir/CURRENT; every save writes a new one and then switches
+    CURRENT over, so a crash never mixes files of two saves.
+
+    Term counts rather than TF-IDF vectors are kept because the IDF weights
+    depend on every document: they are rebuilt from the merged counts on each
+    update, so TF-IDF scores always match a full run over the whole cohort.
+    """
+
+    def __init__(self, state_dir, vector_dtype=DEFAULT_VECTOR_DTYPE):
+        self.state_dir = state_dir
+        self.data_dir = current_dir(state_dir)
+        self.vector_dtype = vector_dtype
+        self.reset()
+
+    def reset(self):
+        self.teams = []
+        self.fingerprints = []
+        self.settings = {}
+        self.vectors = {}
+        self.term_counts = None
+        self.vocabulary = {}
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.teams)
+
+    def _file(self, name):
+        return os.path.join(self.data_dir, name)
+
+    @classmethod
+    def load(cls, state_dir, vector_dtype=DEFAULT_VECTOR_DTYPE):
+        state = cls(state_dir, vector_dtype=vector_dtype)
+        if not os.path.exists(state._file("state.json")):
+            return state
+
+        with open(state._file("state.json")) as f:
+            meta = json.load(f)
+        state.teams = meta["teams"]
+        state.fingerprints = meta["fingerprints"]
+        state.settings = meta["settings"]
+
+        if os.path.exists(state._file("vectors.npz")):
+            # Cohorts saved before the embedding store existed
+            with np.load(state._file("vectors.npz")) as vectors:
+                state.vectors = {name: EmbeddingStore.from_matrix(state.teams, vectors[name], dtype="float32")
+                                 for name in vectors.files}
+        else:
+            state.vectors = {name: EmbeddingStore.open(state._file(f"vectors_{name}"))
+                             for name in CHANNELS if EmbeddingStore.exists(state._file(f"vectors_{name}"))}
+        with np.load(state._file("scores.npz")) as scores:
+            state.scores = {name: scores[name] for name in scores.files}
+        if os.path.exists(state._file("term_counts.npz")):
+            state.term_counts = load_npz(state._file("term_counts.npz")).tocsr()
+            with open(state._file("tfidf_vocabulary.json")) as f:
+                state.vocabulary = {term: column for column, term in enumerate(json.load(f))}
+
+        return state
+
+    def save(self):
+        # Everything goes to a fresh directory; replacing CURRENT is the single
+        # atomic step that makes it the cohort's state. A crash before that leaves
+        # the previous save untouched (plus an orphaned directory, removed below
+        # on the next successful save).
+        previous_dir = self.data_dir
+        version = f"state-{uuid.uuid4().hex[:12]}"
+        self.data_dir = os.path.join(self.state_dir, version)
+        os.makedirs(self.data_dir)
+        for name, store in self.vectors.items():
+            store.save(self._file(f"vectors_{name}"))
+        np.savez(self._file("scores.npz"), **self.scores)
+        save_npz(self._file("term_counts.npz"), self.term_counts)
+        with open(self._file("tfidf_vocabulary.json"), "w") as f:
+            json.dump(sorted(self.vocabulary, key=self.vocabulary.get), f)
+        with open(self._file("state.json"), "w") as f:
+            json.dump({"teams": self.teams, "fingerprints": self.fingerprints, "settings": self.settings}, f)
+
+        tmp_path = os.path.join(self.state_dir, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.state_dir, CURRENT_FILE))
+
+        # Earlier saves (readers that mapped their vectors keep them until closed
+        # on POSIX) and the files of cohorts saved in state_dir itself
+        for entry in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, entry)
+            if entry in (version, CURRENT_FILE):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif previous_dir == self.state_dir:
+                os.remove(path)
+
+    def pairs(self, channel):
+        return pairs_from_matrix(self.teams, self.scores[channel])
+
+
+def _update_scores(old_scores, matrix, updated_rows):
+    # Only the rows (and mirrored columns) of new or changed documents are computed;
+    # matrix is a TF-IDF matrix or an EmbeddingStore, read block by block
+    n = matrix.shape[0]
+    new_rows = similarity_rows(matrix, updated_rows)
+
+    scores = np.zeros((n, n), dtype=np.float32)
+    if old_scores is not None:
+        n_old = old_scores.shape[0]
+        scores[:n_old, :n_old] = old_scores
+
+    scores[updated_rows, :] = new_rows
+    scores[:, updated_rows] = new_rows.T
+    return scores
+
+
+def update_cohort(state, documents, context_model, paraphrase_model, cache=None, chunk_store=None, batch_size=256, progress=None,
+                  context_dim=None, timings=None):
+    """
+    Merge newly uploaded documents into a cohort state, computing only what changed.
+
+    Documents whose team is new or whose content hash differs are embedded by
+    both transformer channels and only their rows of those score matrices are
+    recomputed. Their term counts are merged in and the TF-IDF channel is
+    re-weighted and rescored over the whole cohort, since new documents change
+    the IDF of every term. Documents already in the state are left untouched,
+    including ones missing from this upload.
+
+    context_dim truncates the context (MRL) vectors; like the models and chunking
+    settings, changing it starts the cohort afresh. timings, if given, is filled
+    with {channel: {team_name: encoding seconds}}.
+
+    Returns:
+    - list: Team names that were added or updated.
+    """
+    first_document = next(iter(documents.values()), None)
+    settings = {
+        "context_model": context_model,
+        "paraphrase_model": paraphrase_model,
+        "chunk_size": first_document.chunk_size if first_document else None,
+        "chunk_overlap": first_document.chunk_overlap if first_document else None,
+    }
+    backends = {name: resolve_backend(model) for name, model in (("context", context_model), ("paraphrase", paraphrase_model))}
+    if any(backend != "torch" for backend in backends.values()):
+        # Only recorded when not the default, so existing cohorts keep their settings
+        settings["backends"] = backends
+    if context_dim is not None:
+        settings["context_dim"] = context_dim
+    if state.settings and state.settings != settings:
+        # Vectors from different models or chunking cannot be mixed
+        state.reset()
+    if state.teams and state.term_counts is None:
+        # Saved before term counts were kept: TF-IDF could not be re-weighted
+        state.reset()
+    state.settings = settings
+
+    position = {team: i for i, team in enumerate(state.teams)}
+    changed = [
+        team for team, document in documents.items()
+        if team not in position or state.fingerprints[position[team]] != document.content_hash
+    ]
+    if not changed:
+        return []
+
+    for team in changed:
+        if team in position:
+            state.fingerprints[position[team]] = documents[team].content_hash
+        else:
+            position[team] = len(state.teams)
+            state.teams.append(team)
+            state.fingerprints.append(documents[team].content_hash)
+    n_total = len(state.teams)
+    updated_rows = np.array([position[team] for team in changed], dtype=np.int64)
+    todo = {team: documents[team] for team in changed}
+
+    for channel, embed_model in (("context", context_model), ("paraphrase", paraphrase_model)):
+        channel_progress = None
+        if progress is not None:
+            channel_progress = lambda stage, done=None, total=None: progress(f"{stage} ({channel})", done, total)
+        embeddings = create_document_embeddings(todo, embed_model, batch_size=batch_size, cache=cache,
+                                                chunk_store=chunk_store if channel == "context" else None,
+                                                progress=channel_progress,
+                                                truncate_dim=context_dim if channel == "context" else None,
+                                                timings=timings.setdefault(channel, {}) if timings is not None else None)
+        new_vectors = np.vstack([embeddings[team] for team in changed])
+        old_store = state.vectors.get(channel)
+        merged = _merge_rows(old_store.dense() if old_store is not None else None, new_vectors, n_total, updated_rows)
+        state.vectors[channel] = EmbeddingStore.from_matrix(state.teams, merged, dtype=state.vector_dtype)
+
+    new_counts = count_terms((todo[team].text for team in changed), state.vocabulary)
+    old_counts = state.term_counts
+    if old_counts is not None:
+        # New terms only add columns; old documents have zero counts for them
+        old_counts = old_counts.copy()
+        old_counts.resize((old_counts.shape[0], len(state.vocabulary)))
+    state.term_counts = _merge_rows(old_counts, new_counts, n_total, updated_rows)
+
+    for channel in ("context", "paraphrase"):
+        state.scores[channel] = _update_scores(state.scores.get(channel), state.vectors[channel], updated_rows)
+    state.scores["tfidf"] = _update_scores(None, tfidf_from_counts(state.term_counts), np.arange(n_total))
+
+    return changed
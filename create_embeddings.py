@@ -1,64 +1,112 @@
 import os
-import torch
-from sentence_transformers import SentenceTransformer
-from embed import load_and_chunk_multiple_pdfs_faster
-import fitz  # PyMuPDF
+import numpy as np
+from embed import iter_encoded_documents, pool_document_embeddings, truncate_embeddings
+from document_store import extract_documents
+from model_registry import get_model, resolve_backend
 
-from tfidf_embed import embed_using_tfidf  # Uncomment if you want to use the TF-IDF embedding function
+from tfidf_embed import fit_tfidf_corpus
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 
-#for context aware embeddings
-def create_embeddings_context_aware(pdf_paths, embed_model='sentence-transformers/static-similarity-mrl-multilingual-v1'):
-    model = SentenceTransformer(embed_model)
-    device = torch.device("cpu")
-    model.to(device)
+def create_document_embeddings(documents, embed_model, batch_size=256, cache=None, chunk_store=None, progress=None, stats=None,
+                               backend=None, truncate_dim=None, timings=None):
+    """
+    Document embeddings for {team_name: ExtractedDocument} with one model.
+
+    Cached documents are read from cache; only the rest are encoded, as one
+    batched stream consumed slice by slice (embed.iter_encoded_documents), so
+    memory depends on batch_size and the largest document, not the corpus.
+    Chunk embeddings are added to chunk_store when one is given (which does keep
+    all of them; pass only the documents whose passages are needed), and cache hits
+    and encoded chunk counts to the stats dict. backend selects the inference
+    backend (see model_registry); non-default backends get their own cache entries.
+    truncate_dim keeps only the first truncate_dim components of every chunk vector
+    (Matryoshka models only); the truncated vectors are what is pooled, cached
+    and stored. timings, if given, is filled with the encoding wall seconds of each
+    encoded (not cached) team (see embed.iter_encoded_documents).
+
+    Returns:
+    - dict: {team_name: 1 x d np.ndarray}, in the order of documents.
+    """
     embeddings = {}
+    missing = documents
+    backend = resolve_backend(embed_model, backend)
+    backend_variant = "" if backend == "torch" else f"backend={backend}"
+    dim_variant = "" if truncate_dim is None else f"dim={truncate_dim}"
 
-    for pdf in pdf_paths:
-        try:
-            team_name = os.path.basename(pdf).split(".pdf")[0].split(" ")[1]
-        except:
-            team_name = os.path.basename(pdf).split(".pdf")[0]
-            
-        embeddings[team_name] = load_and_chunk_multiple_pdfs_faster(pdf, model=model)
+    if cache is not None:
+        keys = {team_name: cache.make_key(document.content_hash, embed_model, document.chunk_size, document.chunk_overlap,
+                                          variant=";".join(filter(None, (backend_variant, dim_variant, document.variant))))
+                for team_name, document in documents.items()}
+        missing = {}
+        for team_name, document in documents.items():
+            entry = cache.get(keys[team_name])
+            if entry is None:
+                missing[team_name] = document
+            else:
+                embeddings[team_name] = entry[0].reshape(1,-1)
+                if chunk_store is not None:
+                    chunk_store.add(team_name, entry[1], document)
 
-    return embeddings
+    if missing:
+        model = get_model(embed_model, backend=backend)
+
+        # One encoding stream across all documents; each team is pooled (and its
+        # chunk vectors handed on) as soon as its last chunk is encoded
+        chunks_by_team = {team_name: document.chunks for team_name, document in missing.items()}
+        for team_name, chunk_embeddings in iter_encoded_documents(chunks_by_team, model=model, batch_size=batch_size,
+                                                                  progress=progress, timings=timings):
+            chunk_embeddings = truncate_embeddings(chunk_embeddings, truncate_dim)
+            offsets = np.array([0, len(chunk_embeddings)], dtype=np.int64)
+            document_embedding = pool_document_embeddings(chunk_embeddings, offsets)[0]
+            embeddings[team_name] = document_embedding.reshape(1,-1)
+            if chunk_store is not None:
+                chunk_store.add(team_name, chunk_embeddings, missing[team_name])
+            if cache is not None:
+                cache.put(keys[team_name], document_embedding, chunk_embeddings)
+
+        if cache is not None:
+            cache.evict()
+
+    if stats is not None:
+        stats["cache_hits"] = len(documents) - len(missing)
+        stats["chunks_encoded"] = sum(len(document.chunks) for document in missing.values())
+
+    # Keep the caller's document order regardless of which entries were cached
+    return {team_name: embeddings[team_name] for team_name in documents}
+
+#for context aware embeddings
+def create_embeddings_context_aware(pdf_paths, embed_model='sentence-transformers/static-similarity-mrl-multilingual-v1', documents=None, workers=None, batch_size=256, cache=None, chunk_store=None, truncate_dim=None):
+    if documents is None:
+        documents = extract_documents(pdf_paths, workers=workers)
+
+    return create_document_embeddings(documents, embed_model, batch_size=batch_size, cache=cache, chunk_store=chunk_store,
+                                      truncate_dim=truncate_dim)
 
 #for para-phrase embeddings
 
-def create_embeddings_paraphrase_aware(pdf_paths, embed_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
-    model = SentenceTransformer(embed_model)
-    device = torch.device("cpu")
-    model.to(device)
-    embeddings = {}
+def create_embeddings_paraphrase_aware(pdf_paths, embed_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2', documents=None, workers=None, batch_size=256, cache=None, chunk_store=None):
+    if documents is None:
+        documents = extract_documents(pdf_paths, workers=workers)
 
-    for pdf in pdf_paths:
-        
-        try:
-            team_name = os.path.basename(pdf).split(".pdf")[0].split(" ")[1]
-        except:
-            team_name = os.path.basename(pdf).split(".pdf")[0]
-        embeddings[team_name] = load_and_chunk_multiple_pdfs_faster(pdf, model=model)
+    return create_document_embeddings(documents, embed_model, batch_size=batch_size, cache=cache, chunk_store=chunk_store)
 
-    return embeddings
+def create_tfidf_matrix(pdf_paths, documents=None, workers=None):
+    if documents is None:
+        documents = extract_documents(pdf_paths, workers=workers)
+
+    # Fit a single vocabulary over the whole batch; texts are joined one document
+    # at a time as the vectorizer consumes them
+    team_names = list(documents.keys())
+    _, matrix = fit_tfidf_corpus(document.text for document in documents.values())
 
-def create_tfidf_embeddings(pdf_paths):
+    return team_names, matrix
 
-    def extract_text_from_pdf(pdf_path):
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
-        return text
+def create_tfidf_embeddings(pdf_paths, documents=None, workers=None):
+    team_names, matrix = create_tfidf_matrix(pdf_paths, documents=documents, workers=workers)
     embeddings = {}
 
-    for pdf in pdf_paths:
-        try:
-            team_name = os.path.basename(pdf).split(".pdf")[0].split(" ")[1]
-        except:
-            team_name = os.path.basename(pdf).split(".pdf")[0]
-        text = extract_text_from_pdf(pdf)
-        embeddings[team_name] = embed_using_tfidf(text)
+    # Each value is a sparse 1 x vocabulary row of the shared matrix
+    for i, team_name in enumerate(team_names):
+        embeddings[team_name] = matrix[i]
 
     return embeddings
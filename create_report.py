@@ -1,59 +1,139 @@
-import pandas as pd
+import csv
+import heapq
+import json
+import numpy as np
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import (
     SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 )
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from io import BytesIO
+from io import BytesIO, StringIO
+from calculate_similarity import DEFAULT_WEIGHTS
 
 
-def save_similarity_report(similarity_dict, output_path):
+def top_pairs(pairs, n=15):
     """
-    Generate a professional PDF report of team similarity analysis.
+    The n highest-scoring pairs, best first.
 
     Parameters:
-    - similarity_dict (dict): {'Team A and Team B': similarity_score (float)}
-    - output_path (str): PDF file path to save
+    - pairs (PairScores | dict): Composite scores, or a legacy
+      {'Team A and Team B': score} dict.
+
+    Returns:
+    - list of (label, score) tuples.
     """
-    print("#########")
-    print(similarity_dict)
-    print("#########")
-
-    def get_risk_label(score):
-        if score < 0.60:
-            return "No Risk"
-        elif score < 0.70:
-            return "Moderate Similarity"
-        elif score < 0.80:
-            return "Warning"
-        else:
-            return "Possible Risk"
-    # For top-level similarity
-    def get_top_n_teams(n=20):
-        """
-        Get the top N teams based on similarity scores.
-        """
-        sorted_final_sim = sorted(similarity_dict.items(), key=lambda item: item[1], reverse=True)
-
-        sorted_dict = {}
-        for team_pair, score in sorted_final_sim[:n]:
-            sorted_dict[team_pair] = score
-        return sorted_dict
-
-    top_n_dict = get_top_n_teams(15)
-    # Filter for scores >= 0.60
-    df = pd.DataFrame([
-        {"Teams": k, "Similarity Score": round(v, 2), }
-        for k, v in top_n_dict.items() 
-    ])
-    print(df)
+    if isinstance(pairs, dict):
+        return heapq.nlargest(n, pairs.items(), key=lambda item: item[1])
+
+    top = _top_indices(pairs, n)
+    return list(zip(pairs.labels(top), (float(pairs.scores[i]) for i in top)))
+
+
+def _top_indices(pairs, n):
+    scores = np.nan_to_num(pairs.scores.astype(np.float64), nan=-np.inf)
+    n = min(n, len(scores))
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Partial selection: only the top n are sorted, not every pair
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _flagged_indices(pairs, threshold):
+    flagged = np.flatnonzero(pairs.scores >= threshold)
+    return flagged[np.argsort(-pairs.scores[flagged], kind="stable")]
+
+
+def _screened_marks(pairs, index, screened):
+    # Per listed pair: True if the cascade screened it out of the paraphrase channel
+    if screened is None or isinstance(pairs, dict):
+        return None
+    return [bool(screened[i]) for i in index]
+
+
+def flagged_pairs(pairs, threshold=0.80):
+    """
+    Every pair scoring at least threshold, best first, as (label, score) tuples.
+    """
+    if isinstance(pairs, dict):
+        return sorted(((label, score) for label, score in pairs.items() if score >= threshold),
+                      key=lambda item: item[1], reverse=True)
+
+    flagged = _flagged_indices(pairs, threshold)
+    return list(zip(pairs.labels(flagged), (float(pairs.scores[i]) for i in flagged)))
+
+
+def export_flagged_pairs(pairs, threshold=0.80, fmt="csv", decimals=4, screened=None):
+    """
+    Flagged pairs as CSV or JSON bytes, for cohorts too large for a PDF table.
+
+    Parameters:
+    - fmt (str): "csv" or "json".
+    - screened (np.ndarray): Optional boolean mask over pairs (PairScores only) of
+      the pairs cascade mode kept from the paraphrase channel. Their scores blend
+      fewer channels, so each row then says whether it was screened out.
+    """
+    rows = [(label, round(score, decimals)) for label, score in flagged_pairs(pairs, threshold)]
+    marks = None if isinstance(pairs, dict) else _screened_marks(pairs, _flagged_indices(pairs, threshold), screened)
+    if fmt == "json":
+        records = [{"teams": label, "similarity_score": score} for label, score in rows]
+        if marks is not None:
+            for record, mark in zip(records, marks):
+                record["paraphrase_screened_out"] = mark
+        return json.dumps(records).encode("utf-8")
+    if fmt != "csv":
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    if marks is None:
+        writer.writerow(["Teams", "Similarity Score"])
+        writer.writerows(rows)
+    else:
+        writer.writerow(["Teams", "Similarity Score", "Paraphrase Screened Out"])
+        writer.writerows((label, score, mark) for (label, score), mark in zip(rows, marks))
+    return buffer.getvalue().encode("utf-8")
+
+
+# Methodology entry of each composite channel, in report order
+_CHANNEL_DESCRIPTIONS = {
+    "context": ("Contextual Similarity", "emphasizes conceptual overlap and rephrased similarities."),
+    "paraphrase": ("Paraphrasing Detection", "captures meaning-preserving rewording."),
+    "tfidf": ("TF-IDF", "retains sensitivity to exact phrase-level copying."),
+    "minhash": ("Shingle Overlap (MinHash)", "estimates the share of identical word sequences, i.e. copy-paste."),
+}
+
+
+def render_similarity_report(pairs, n=15, weights=None, screened=None):
+    """
+    Generate a professional PDF report of team similarity analysis in memory.
+
+    Parameters:
+    - pairs (PairScores | dict): Composite scores, or a legacy
+      {'Team A and Team B': similarity_score (float)} dict.
+    - n (int): Number of top pairs in the table.
+    - weights (dict): Channel weights the composite was computed with, listed in
+      the methodology; defaults to calculate_similarity.DEFAULT_WEIGHTS.
+    - screened (np.ndarray): Optional boolean mask over pairs (PairScores only) of
+      the pairs cascade mode kept from the paraphrase channel; they are marked
+      with an asterisk in the table.
 
-    
+    Returns:
+    - bytes: The PDF document.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    rows = [[label, round(score, 2)] for label, score in top_pairs(pairs, n)]
+    marks = None if isinstance(pairs, dict) else _screened_marks(pairs, _top_indices(pairs, n), screened)
+    if marks is not None:
+        for row, mark in zip(rows, marks):
+            if mark:
+                row[0] += " *"
 
     # Setup PDF
-    doc = SimpleDocTemplate(output_path, pagesize=A4)
-    #doc = SimpleDocTemplate(buffer, pagesize=A4)
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
     styles = getSampleStyleSheet()
 
@@ -74,7 +154,7 @@ def save_similarity_report(similarity_dict, output_path):
     elements.append(Paragraph("Top 20 Project Submission Pairs with Highest Detected Similarity", section_header_style))
 
     # === Table ===
-    table_data = [list(df.columns)] + df.values.tolist()
+    table_data = [["Teams", "Similarity Score"]] + rows
     table = Table(table_data, hAlign="CENTER", colWidths=[220, 100, 100])
     style = TableStyle([
         ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#003366")),
@@ -99,7 +179,7 @@ def save_similarity_report(similarity_dict, output_path):
         style.add("BACKGROUND", (0, i), (-1, i), bg)
     """
 
-    for i, row in enumerate(df.itertuples(), start=1):
+    for i in range(1, len(rows) + 1):
         
         bg = colors.whitesmoke
         
@@ -112,6 +192,10 @@ def save_similarity_report(similarity_dict, output_path):
 
     #elements.append(Paragraph("High Similarity: Significant textual or structural similarity detected — manual review strongly recommended."))
     elements.append(Spacer(1, 12))
+    if marks is not None and any(marks):
+        elements.append(Paragraph("* Screened out before the paraphrase channel (cascade mode): the score blends the "
+                                  "contextual and TF-IDF channels only and is not on the same scale as the others."))
+        elements.append(Spacer(1, 6))
     elements.append(Paragraph("The following team submissions require manual evaluation for possible similarity concerns."))
 
 
@@ -152,16 +236,31 @@ def save_similarity_report(similarity_dict, output_path):
 
     <b>4. Composite Similarity Score:</b><br/>
     To ensure a balanced evaluation, we compute a composite score by combining the outputs from each method:<br/>
-    • <b>Contextual Similarity:</b> 0.4 weight — emphasizes conceptual overlap and rephrased similarities.<br/>
-    • <b>Paraphrasing Detection:</b> 0.4 weight — captures meaning-preserving rewording.<br/>
-    • <b>TF-IDF:</b> 0.2 weight — retains sensitivity to exact phrase-level copying.<br/><br/>
+    {weight_lines}<br/>
     This weighting scheme ensures that the final score reflects both deep semantic similarity and surface-level duplication while avoiding over-penalizing coincidental keyword matches.
 
 
     """
-    elements.append(Paragraph(methodology_text, styles["Normal"]))
+    weight_lines = "".join(
+        f"• <b>{title}:</b> {round(weights[name], 2):g} weight — {description}<br/>\n"
+        for name, (title, description) in _CHANNEL_DESCRIPTIONS.items() if weights.get(name)
+    )
+    elements.append(Paragraph(methodology_text.format(weight_lines=weight_lines), styles["Normal"]))
 
     # === Build PDF ===
     doc.build(elements)
-    
+    return buffer.getvalue()
+
+
+def save_similarity_report(similarity_dict, output_path):
+    """
+    Write the PDF report to output_path; see render_similarity_report.
+
+    Parameters:
+    - similarity_dict (PairScores | dict): {'Team A and Team B': similarity_score (float)}
+    - output_path (str): PDF file path to save
+    """
+    report = render_similarity_report(similarity_dict)
+    with open(output_path, "wb") as f:
+        f.write(report)
     print(f"Report saved to {output_path}")
\ No newline at end of file
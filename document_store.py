@@ -0,0 +1,351 @@
+import hashlib
+import logging
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import fitz  # PyMuPDF
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from profiling import peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+
+def get_team_name(pdf):
+    # The extension is matched in any case, like the .pdf filters below
+    stem = os.path.splitext(os.path.basename(pdf))[0]
+    try:
+        return stem.split(" ")[1]
+    except IndexError:
+        return stem
+
+
+def create_text_splitter(chunk_size=256, chunk_overlap=64):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+
+        separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""],
+        keep_separator=True,
+        add_start_index=True
+    )
+
+
+class ExtractedDocument:
+    """
+    One parsed submission, shared by every similarity channel.
+
+    Attributes:
+    - team_name (str): Team identifier derived from the file name.
+    - path (str): Source PDF path.
+    - pages (list): Raw text of each page, in page order.
+    - chunks (list): Text chunks produced page by page with the shared splitter.
+    - chunk_pages, chunk_offsets (list): Page number (0-based) and character offset
+      within that page where each chunk starts.
+    - content_hash (str): SHA-256 of the PDF bytes, used to key cached embeddings.
+    - chunk_size, chunk_overlap (int): Splitter settings the chunks were made with.
+    - variant (str): Non-empty when chunks were filtered after splitting (see
+      boilerplate.py); part of the embedding cache key.
+    - stats (dict): Size, timing, CPU time and peak memory of parsing and chunking,
+      for profiling.
+    """
+
+    def __init__(self, team_name, path, pages, chunks, content_hash=None, chunk_size=256, chunk_overlap=64,
+                 chunk_pages=None, chunk_offsets=None, variant=""):
+        self.team_name = team_name
+        self.path = path
+        self.pages = pages
+        self.chunks = chunks
+        self.chunk_pages = chunk_pages if chunk_pages is not None else [0] * len(chunks)
+        self.chunk_offsets = chunk_offsets if chunk_offsets is not None else [0] * len(chunks)
+        self.content_hash = content_hash
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.variant = variant
+        self.stats = {}
+
+    @property
+    def text(self):
+        return "".join(self.pages)
+
+
+def iter_pdf_pages(data):
+    """
+    Yield the text of each page of a PDF held in memory, one page at a time.
+    """
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        for page in doc:
+            yield page.get_text()
+    finally:
+        doc.close()
+
+
+def iter_page_chunks(pages, text_splitter):
+    """
+    Split pages one at a time.
+
+    Yields:
+    - (page_number, start_index, chunk_text): page_number is 0-based and
+      start_index is the chunk's character offset within that page.
+    """
+    for page_number, page_text in enumerate(pages):
+        for chunk in text_splitter.create_documents([page_text]):
+            yield page_number, chunk.metadata["start_index"], chunk.page_content
+
+
+def extract_document_from_bytes(name, data, chunk_size=256, chunk_overlap=64):
+    """
+    Parse and chunk one PDF held in memory; name is its file or archive member name.
+
+    Pages are parsed and split one at a time, so no intermediate per-page
+    objects are built for the whole report.
+    """
+    text_splitter = create_text_splitter(chunk_size, chunk_overlap)
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    pages = []
+    parse_seconds = 0.0
+    page_iterator = iter_pdf_pages(data)
+
+    def timed_pages():
+        # Parse time is measured around each page pull, chunking time is the rest
+        nonlocal parse_seconds
+        while True:
+            parse_start = time.perf_counter()
+            page_text = next(page_iterator, None)
+            parse_seconds += time.perf_counter() - parse_start
+            if page_text is None:
+                return
+            pages.append(page_text)
+            yield page_text
+
+    # Remember where every chunk came from. CPU time is that of this thread, so
+    # documents parsed concurrently (threads or other jobs) are not mixed up
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    all_chunks, chunk_pages, chunk_offsets = [], [], []
+    for page_number, offset, chunk in iter_page_chunks(timed_pages(), text_splitter):
+        all_chunks.append(chunk)
+        chunk_pages.append(page_number)
+        chunk_offsets.append(offset)
+    total_seconds = time.perf_counter() - start
+    cpu_seconds = time.thread_time() - cpu_start
+
+    document = ExtractedDocument(get_team_name(name), name, pages, all_chunks,
+                                 content_hash=content_hash, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                 chunk_pages=chunk_pages, chunk_offsets=chunk_offsets)
+    document.stats = {
+        "bytes": len(data),
+        "pages": len(pages),
+        "chunks": len(all_chunks),
+        "parse_seconds": round(parse_seconds, 4),
+        "chunk_seconds": round(total_seconds - parse_seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        # High-water mark of the parsing process (a pool worker or this one) once
+        # this document is done; the document that raises it is the one to look at
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return document
+
+
+def extract_document(pdf_path, chunk_size=256, chunk_overlap=64):
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+
+    return extract_document_from_bytes(pdf_path, data, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _source_name(source):
+    # A source is either a PDF path or a (name, bytes) pair read from an archive
+    return source if isinstance(source, str) else source[0]
+
+
+def _extract_document_safe(source, chunk_size, chunk_overlap):
+    # Runs inside a worker process; report errors instead of raising so one bad PDF
+    # cannot take the rest of the batch down with it
+    try:
+        if isinstance(source, str):
+            document = extract_document(source, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        else:
+            document = extract_document_from_bytes(source[0], source[1], chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        return document, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _extract_isolated(source, chunk_size, chunk_overlap):
+    # Last resort after a worker died: give the document a pool of its own so a
+    # hard crash inside MuPDF only loses this one file
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_extract_document_safe, source, chunk_size, chunk_overlap).result()
+    except BrokenProcessPool:
+        return None, "worker process crashed while parsing"
+
+
+def _extract_parallel(sources, chunk_size, chunk_overlap, workers):
+    # Yields (source_name, (document, error)) in input order. At most 2 * workers
+    # sources are in flight, so archive members are only read shortly before use.
+    executor = ProcessPoolExecutor(max_workers=workers)
+    in_flight = deque()
+
+    def submit(source):
+        nonlocal executor
+        try:
+            return executor.submit(_extract_document_safe, source, chunk_size, chunk_overlap)
+        except BrokenProcessPool:
+            executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(max_workers=workers)
+            return executor.submit(_extract_document_safe, source, chunk_size, chunk_overlap)
+
+    def collect():
+        source, future = in_flight.popleft()
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            result = _extract_isolated(source, chunk_size, chunk_overlap)
+        return _source_name(source), result
+
+    try:
+        for source in sources:
+            in_flight.append((source, submit(source)))
+            if len(in_flight) >= 2 * workers:
+                yield collect()
+        while in_flight:
+            yield collect()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_sequential(sources, chunk_size, chunk_overlap):
+    for source in sources:
+        yield _source_name(source), _extract_document_safe(source, chunk_size, chunk_overlap)
+
+
+def _collect_documents(results, errors, progress=None, total=None):
+    documents = {}
+    for done, (name, (document, error)) in enumerate(results, start=1):
+        if progress is not None:
+            progress("Parsing PDFs", done, total)
+        if document is None:
+            logger.warning("Skipping %s: %s", name, error)
+            if errors is not None:
+                errors[name] = error
+            continue
+        if document.team_name in documents:
+            # Two files map to the same team (e.g. "Team 0001.pdf" and
+            # "sub/Team 0001.pdf"); keep both, the later one under its file name
+            unique_name = f"{document.team_name} ({name})"
+            logger.warning("Team %s already has a report; analysing %s as %s", document.team_name, name, unique_name)
+            document.team_name = unique_name
+        documents[document.team_name] = document
+
+    return documents
+
+
+def extract_documents(pdf_paths, chunk_size=256, chunk_overlap=64, workers=None, errors=None, progress=None):
+    """
+    Parse and chunk every PDF exactly once.
+
+    Parameters:
+    - pdf_paths (list): PDF files to ingest.
+    - workers (int): Size of the process pool. None or 1 parses in the current process.
+    - errors (dict): Optional; filled with {pdf_path: message} for files that failed.
+    - progress (callable): Optional; called as progress(stage, done, total) per document.
+
+    Returns:
+    - dict: {team_name: ExtractedDocument}, in the order of pdf_paths. Files that
+      failed to parse are left out. A file whose team already has a report is
+      kept under "<team> (<path>)".
+    """
+    pdf_paths = list(pdf_paths)
+
+    if workers is not None and workers > 1 and len(pdf_paths) > 1:
+        results = _extract_parallel(pdf_paths, chunk_size, chunk_overlap, min(workers, len(pdf_paths)))
+    else:
+        results = _extract_sequential(pdf_paths, chunk_size, chunk_overlap)
+
+    return _collect_documents(results, errors, progress, len(pdf_paths))
+
+
+def list_zip_pdfs(zip_ref):
+    # .pdf members sorted by file name, skipping folders and macOS resource forks
+    names = [
+        info.filename for info in zip_ref.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(".pdf")
+        and not os.path.basename(info.filename).startswith("._")
+        and "__MACOSX" not in info.filename
+    ]
+    return sorted(names, key=lambda name: (os.path.basename(name), name))
+
+
+def iter_zip_pdfs(zip_ref):
+    # Read one member at a time, straight from the archive into memory
+    for name in list_zip_pdfs(zip_ref):
+        yield name, zip_ref.read(name)
+
+
+class Corpus:
+    """
+    The documents of one analysis run, isolated from every other run.
+
+    Attributes:
+    - documents (dict): {team_name: ExtractedDocument}
+    - errors (dict): {member_name: message} for PDFs that could not be parsed.
+    - source (str): Where the corpus came from, for display only.
+    """
+
+    def __init__(self, documents, errors=None, source=None):
+        self.documents = documents
+        self.errors = errors if errors is not None else {}
+        self.source = source
+
+    def __len__(self):
+        return len(self.documents)
+
+
+def extract_documents_from_zip(zip_file, chunk_size=256, chunk_overlap=64, workers=None, source=None, progress=None):
+    """
+    Build a Corpus from a ZIP archive without extracting it to disk.
+
+    Each .pdf member is read from the archive and handed to PyMuPDF as an
+    in-memory stream. Only a bounded number of members (2 x workers, or one when
+    parsing in-process) are held in memory at a time.
+
+    Parameters:
+    - zip_file: A path or binary file-like object (e.g. a Streamlit upload).
+    """
+    errors = {}
+    with zipfile.ZipFile(zip_file, "r") as zip_ref:
+        n_members = len(list_zip_pdfs(zip_ref))
+        if workers is not None and workers > 1 and n_members > 1:
+            results = _extract_parallel(iter_zip_pdfs(zip_ref), chunk_size, chunk_overlap, min(workers, n_members))
+        else:
+            results = _extract_sequential(iter_zip_pdfs(zip_ref), chunk_size, chunk_overlap)
+        documents = _collect_documents(results, errors, progress, n_members)
+
+    return Corpus(documents, errors=errors, source=source)
+
+
+def list_directory_pdfs(directory):
+    # .pdf files directly inside directory, sorted by file name like ZIP members
+    names = [
+        name for name in os.listdir(directory)
+        if name.lower().endswith(".pdf") and not name.startswith("._")
+        and os.path.isfile(os.path.join(directory, name))
+    ]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def extract_documents_from_directory(directory, chunk_size=256, chunk_overlap=64, workers=None, source=None, progress=None):
+    """
+    Build a Corpus from the PDF files in a directory; see extract_documents.
+    """
+    errors = {}
+    documents = extract_documents(list_directory_pdfs(directory), chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                  workers=workers, errors=errors, progress=progress)
+    return Corpus(documents, errors=errors, source=source or directory)
@@ -1,41 +1,138 @@
 
-from langchain.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from document_store import extract_document
+from model_registry import get_model
 embed_model = 'sentence-transformers/static-similarity-mrl-multilingual-v1'
-model = SentenceTransformer(embed_model)
 
-def load_and_chunk_multiple_pdfs_faster(pdf_paths, chunk_size=256, chunk_overlap=64, model=model):
-    
+def embed_chunks(all_chunks, model=None):
+    if model is None:
+        model = get_model(embed_model)
+    embeddings = model.encode(all_chunks, normalize_embeddings=True)
+    document_embedding = np.mean(embeddings, axis=0)  # Simple average
+    document_embedding = document_embedding / np.linalg.norm(document_embedding)  # Normalize
 
+    return document_embedding.reshape(1,-1)
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
+def check_truncate_dim(dim):
+    # dim <= 0 would slice off trailing components or leave zero-width vectors
+    # that score 0 against everything
+    if dim is not None and dim <= 0:
+        raise ValueError(f"Truncation dimension must be positive, got {dim}")
 
-        separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""],
-        keep_separator=True
-    )
+def truncate_embeddings(embeddings, dim):
+    """
+    Keep the first dim components of each row and re-normalise (Matryoshka truncation).
 
-    loader = PyMuPDFLoader(pdf_paths)
-    docs = loader.load()
+    Only meaningful for models trained with Matryoshka representation learning,
+    such as the static MRL context model, whose leading components carry most of
+    the signal. All-zero rows stay zero; dim None or >= width returns the input.
+    """
+    check_truncate_dim(dim)
+    if dim is None or dim >= embeddings.shape[1]:
+        return embeddings
+    truncated = np.array(embeddings[:, :dim], dtype=np.float32)
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return truncated / norms
 
-    # Process each page individually
-    all_chunks = []
-    for doc in docs:
-        chunks = text_splitter.split_text(doc.page_content)
-        all_chunks.extend(chunks)
+def pool_document_embeddings(chunk_embeddings, offsets):
+    # Mean-pool each document's slice of the stream, then re-normalise.
+    # Documents without any chunks keep an all-zero row.
+    counts = np.diff(offsets)
+    has_chunks = counts > 0
+    document_embeddings = np.zeros((len(counts), chunk_embeddings.shape[1]), dtype=np.float32)
+    if not has_chunks.any():
+        return document_embeddings
 
-    embeddings = model.encode(all_chunks, normalize_embeddings=True)
-    document_embedding = np.mean(embeddings, axis=0)  # Simple average
-    document_embedding = document_embedding / np.linalg.norm(document_embedding)  # Normalize
+    sums = np.add.reduceat(chunk_embeddings, offsets[:-1][has_chunks], axis=0)
+    means = sums / counts[has_chunks][:, None]
+    document_embeddings[has_chunks] = means / np.linalg.norm(means, axis=1, keepdims=True)
 
+    return document_embeddings
 
-    return document_embedding.reshape(1,-1)
+def iter_encoded_documents(chunks_by_team, model=None, batch_size=256, slice_size=None, progress=None, timings=None):
+    """
+    Encode the chunks of many documents as a stream of bounded slices.
+
+    Chunks are pulled from chunks_by_team lazily and encoded slice_size at a time
+    (default 16 batches), so only one slice of chunk texts and embeddings is held,
+    plus the document currently being assembled, however large the corpus.
+
+    Parameters:
+    - chunks_by_team (dict): {team_name: iterable of chunks}
+    - progress (callable): Optional; called as progress("Encoding", done_chunks, total_chunks)
+      after every slice when the chunk counts are known (lists), else with total None.
+    - timings (dict): Optional; filled with {team_name: encoding wall seconds}. A
+      slice's time is split over its documents by their share of its chunks.
+
+    Yields:
+    - (team_name, chunk_embeddings): Normalised float32 embeddings of each team's
+      chunks, in the order of chunks_by_team, as soon as the team is complete.
+    """
+    if model is None:
+        model = get_model(embed_model)
+    slice_size = slice_size or batch_size * 16
+    total = None
+    if all(isinstance(chunks, (list, tuple)) for chunks in chunks_by_team.values()):
+        total = sum(len(chunks) for chunks in chunks_by_team.values())
+
+    pending = []  # [team_name, [embedding blocks], complete], in stream order
+    texts = []
+    runs = []  # [entry, chunk count] of the buffered texts; each team's chunks are contiguous
+    done = 0
+    dimension = None
 
+    def flush():
+        nonlocal done, dimension
+        if texts:
+            encode_start = time.perf_counter()
+            embeddings = np.asarray(model.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+            seconds_per_chunk = (time.perf_counter() - encode_start) / len(texts)
+            dimension = embeddings.shape[1]
+            start = 0
+            for entry, count in runs:
+                entry[1].append(embeddings[start:start + count])
+                start += count
+                if timings is not None:
+                    timings[entry[0]] = timings.get(entry[0], 0.0) + seconds_per_chunk * count
+            done += len(texts)
+            if progress is not None:
+                progress("Encoding", done, total)
+        texts.clear()
+        runs.clear()
 
+    def finished():
+        nonlocal dimension
+        # Hand out complete teams from the head of the queue; a team is complete once
+        # all of its chunks are read and none of them is still waiting in the buffer
+        while pending and pending[0][2] and not (runs and runs[0][0] is pending[0]):
+            team_name, blocks, _ = pending.pop(0)
+            if blocks:
+                yield team_name, np.concatenate(blocks)
+                continue
+            if dimension is None:
+                dimension = model.get_sentence_embedding_dimension() or 0
+            yield team_name, np.zeros((0, dimension), dtype=np.float32)
 
+    for team_name, chunks in chunks_by_team.items():
+        entry = [team_name, [], False]
+        pending.append(entry)
+        for chunk in chunks:
+            if not runs or runs[-1][0] is not entry:
+                runs.append([entry, 0])
+            texts.append(chunk)
+            runs[-1][1] += 1
+            if len(texts) >= slice_size:
+                flush()
+                yield from finished()
+        entry[2] = True
+        yield from finished()
+    flush()
+    yield from finished()
 
+def load_and_chunk_multiple_pdfs_faster(pdf_paths, chunk_size=256, chunk_overlap=64, model=None):
+    document = extract_document(pdf_paths, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
+    return embed_chunks(document.chunks, model=model)
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+# Override with EMBEDDING_CACHE_DIR / EMBEDDING_CACHE_MAX_MB on shared servers
+DEFAULT_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", ".embedding_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed store for document and chunk embeddings.
+
+    Entries are keyed by the PDF content hash, the model id and the chunking
+    settings, so renamed or re-uploaded files still hit and any change to the
+    inputs misses. Each entry is one .npz file; its modification time doubles as
+    the last-used time, and the least recently used entries are deleted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, model_name, chunk_size, chunk_overlap, variant=""):
+        payload = json.dumps([content_hash, model_name, chunk_size, chunk_overlap, variant])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Returns:
+        - (document_embedding, chunk_embeddings) or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                document_embedding = entry["document"]
+                chunk_embeddings = entry["chunks"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return document_embedding, chunk_embeddings
+
+    def put(self, key, document_embedding, chunk_embeddings):
+        # Chunk vectors are kept in float16 to halve the footprint; the pooled
+        # document vector stays float32 so cached scores match fresh ones.
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     document=np.asarray(document_embedding, dtype=np.float32),
+                     chunks=np.asarray(chunk_embeddings, dtype=np.float16))
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+            except OSError:
+                pass
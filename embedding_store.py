@@ -0,0 +1,162 @@
+import json
+import os
+import numpy as np
+from similarity_engine import NeighbourIndex, all_pairs_similarity, normalize_rows
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def _save_array(path, array):
+    # Written to a temp file first: replacing keeps readers that still map the old file valid
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    """
+    Document vectors as one contiguous, optionally quantised matrix plus a team index.
+
+    Rows are L2-normalised before they are stored, as:
+    - float32: exact,
+    - float16: half the size, about 1e-3 relative error per component,
+    - int8: a quarter of the size, with one float32 scale per row
+      (value = int8 * scale).
+
+    A saved store is a directory with vectors.npy, scales.npy (int8 only) and
+    index.json. open() memory-maps the arrays read-only, so it opens instantly
+    and worker processes reading the same store share the OS page cache instead
+    of each holding a copy. A store can be passed to the similarity_engine
+    kernels in place of a matrix; they read it through dense() and take(), which
+    dequantise only the requested rows, so the full float32 matrix is never built.
+    """
+
+    def __init__(self, teams, data, scales=None):
+        self.teams = list(teams)
+        self.data = data
+        self.scales = scales
+        self.index = {team: i for i, team in enumerate(self.teams)}
+
+    @classmethod
+    def from_matrix(cls, teams, matrix, dtype="float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        matrix = normalize_rows(matrix)
+        if dtype != "int8":
+            return cls(teams, matrix.astype(dtype))
+
+        peak = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(matrix.shape[0], dtype=np.float32)
+        scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+        data = np.round(matrix / scales[:, None]).astype(np.int8)
+        return cls(teams, data, scales)
+
+    def __len__(self):
+        return len(self.teams)
+
+    def __contains__(self, team_name):
+        return team_name in self.index
+
+    @property
+    def dtype(self):
+        return str(self.data.dtype)
+
+    @property
+    def dim(self):
+        return self.data.shape[1] if self.data.ndim == 2 else 0
+
+    @property
+    def shape(self):
+        return (len(self), self.dim)
+
+    def dense(self, start=0, stop=None):
+        # float32 copy of rows start:stop
+        block = np.asarray(self.data[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[start:stop])[:, None]
+        return block
+
+    def take(self, rows):
+        # float32 copy of the given rows, in that order
+        rows = np.asarray(rows, dtype=np.int64)
+        block = np.asarray(self.data[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows])[:, None]
+        return block
+
+    def save(self, store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+        _save_array(os.path.join(store_dir, "vectors.npy"), self.data)
+        if self.scales is not None:
+            _save_array(os.path.join(store_dir, "scales.npy"), self.scales)
+
+        # Not atomic as a whole: a crash can leave new arrays next to the old
+        # index. Save to a new directory and switch over when that matters, as
+        # CohortState.save does
+        tmp_path = os.path.join(store_dir, "index.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"teams": self.teams, "dtype": self.dtype, "dim": self.dim}, f)
+        os.replace(tmp_path, os.path.join(store_dir, "index.json"))
+
+    @classmethod
+    def open(cls, store_dir, mmap=True):
+        with open(os.path.join(store_dir, "index.json")) as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        data = np.load(os.path.join(store_dir, "vectors.npy"), mmap_mode=mmap_mode)
+        scales = None
+        if meta["dtype"] == "int8":
+            scales = np.load(os.path.join(store_dir, "scales.npy"), mmap_mode=mmap_mode)
+        return cls(meta["teams"], data, scales)
+
+    @staticmethod
+    def exists(store_dir):
+        return os.path.exists(os.path.join(store_dir, "index.json"))
+
+
+def _neighbours(row, self_index, k):
+    return set([index for index in row if index != self_index][:k])
+
+
+def check_precision(teams, matrix, dtypes=("float16", "int8"), k=10, threshold=0.80, block_size=1024):
+    """
+    Compare quantised stores against float32 scores on the same vectors.
+
+    Parameters:
+    - k (int): Neighbours compared per document for the top-k overlap.
+    - threshold (float): Flag threshold; a flip is a pair on the other side of it.
+
+    Returns:
+    - dict: {dtype: {"bytes", "max_abs_error", "mean_abs_error", "topk_overlap",
+      "threshold_flips"}}
+    """
+    reference = EmbeddingStore.from_matrix(teams, matrix, dtype="float32")
+    reference_pairs = all_pairs_similarity(reference.teams, reference, block_size=block_size)
+    k = min(k, max(len(reference) - 1, 0))
+    if k:
+        reference_top, _ = NeighbourIndex(reference, block_size=block_size).search(reference.dense(), k=k + 1)
+
+    report = {}
+    for dtype in dtypes:
+        store = EmbeddingStore.from_matrix(teams, matrix, dtype=dtype)
+        pairs = all_pairs_similarity(store.teams, store, block_size=block_size)
+        error = np.abs(pairs.scores - reference_pairs.scores)
+        size = store.data.nbytes + (store.scales.nbytes if store.scales is not None else 0)
+
+        overlap = None
+        if k:
+            top, _ = NeighbourIndex(store, block_size=block_size).search(reference.dense(), k=k + 1)
+            # k + 1 neighbours are searched so the document itself can be dropped
+            overlap = float(np.mean([
+                len(_neighbours(a, i, k) & _neighbours(b, i, k)) / k
+                for i, (a, b) in enumerate(zip(top, reference_top))
+            ]))
+
+        report[dtype] = {
+            "bytes": int(size),
+            "max_abs_error": float(error.max()) if len(error) else 0.0,
+            "mean_abs_error": float(error.mean()) if len(error) else 0.0,
+            "topk_overlap": overlap,
+            "threshold_flips": int(np.sum((pairs.scores >= threshold) != (reference_pairs.scores >= threshold))),
+        }
+    return report
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def upload_key(data, *settings):
+    """
+    Identify an analysis by the uploaded bytes plus every setting that changes its result.
+    """
+    digest = hashlib.sha256(data)
+    for setting in settings:
+        digest.update(b"\0" + repr(setting).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Job:
+    """
+    One background analysis and its progress, safe to read from any thread.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = "Waiting for a free worker"
+        self.done = None
+        self.total = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def report(self, stage, done=None, total=None):
+        # Used as the pipeline's progress callback
+        with self._lock:
+            self.stage = stage
+            self.done = done
+            self.total = total
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def fraction(self):
+        with self._lock:
+            if not self.total:
+                return 1.0 if self.status == "done" else 0.0
+            return min(1.0, (self.done or 0) / self.total)
+
+    def describe(self):
+        with self._lock:
+            if self.total:
+                return f"{self.stage}: {self.done}/{self.total}"
+            return self.stage
+
+
+class JobRunner:
+    """
+    Runs analyses in a bounded pool of worker threads, one job per key.
+
+    Submitting a key that is queued, running or finished returns the existing
+    job, so Streamlit reruns and repeated clicks never start the same work twice.
+    Failed jobs are retried on the next submit. Only the most recent
+    keep_finished finished jobs are kept, results included, so jobs should return
+    only what is displayed (see AnalysisResult.release_documents).
+    """
+
+    def __init__(self, max_workers=1, keep_finished=16):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != "failed":
+                self._jobs.move_to_end(key)
+                return job
+
+            job = Job(key)
+            self._jobs[key] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+            job.status = "done"
+        except Exception:
+            job.error = traceback.format_exc()
+            job.status = "failed"
+            logger.error("Analysis job %s failed:\n%s", job.key, job.error)
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[key]
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner(max_workers=1):
+    # One runner per process, shared by every Streamlit session and rerun
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(max_workers=max_workers)
+    return _runner
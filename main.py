@@ -1,19 +1,101 @@
 import streamlit as st
-import zipfile
 import io
 import os
-from sentence_transformers import SentenceTransformer
-from embed import load_and_chunk_multiple_pdfs_faster
-from tfidf_embed import embed_using_tfidf  # Uncomment if you want to use the TF-IDF embedding function
-from create_embeddings import create_embeddings_context_aware, create_tfidf_embeddings, create_embeddings_paraphrase_aware
-from calculate_similarity import calculate_similarity, calculate_tfidf_similarity, calculate_composite_similarity, calculate_similarity_paraphrase
-from create_report import save_similarity_report
+from cohort_state import cohort_version
+from create_report import export_flagged_pairs
+from embed import check_truncate_dim
+from embedding_cache import EmbeddingCache
+from job_runner import get_job_runner, upload_key
+from minhash import DEFAULT_MAX_BUCKET_FRACTION
+from passage_match import FLAG_THRESHOLD
+from pipeline import analyse_zip, embed_model, paraphrase_model
 import time
 #os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 #
 
-embed_model = 'sentence-transformers/static-similarity-mrl-multilingual-v1'
-
+# Processes used to parse and chunk PDFs; set PDF_WORKERS=1 to parse in-process
+pdf_workers = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+# Embeddings are reused across runs for unchanged PDFs (see EMBEDDING_CACHE_DIR)
+embedding_cache = EmbeddingCache()
+# For very large cohorts, set CANDIDATE_TOP_K to score only each team's nearest
+# neighbours (found on the context channel) instead of every pair; 0 scores all pairs
+candidate_top_k = int(os.environ.get("CANDIDATE_TOP_K", "0"))
+# MINHASH_WEIGHT > 0 adds the MinHash shingle (copy-paste) channel to the composite score
+minhash_weight = float(os.environ.get("MINHASH_WEIGHT", "0"))
+# MINHASH_MAX_BUCKET_FRACTION skips LSH buckets shared by more than that fraction of the reports (template text); 1 keeps all
+minhash_max_bucket_fraction = float(os.environ.get("MINHASH_MAX_BUCKET_FRACTION", str(DEFAULT_MAX_BUCKET_FRACTION)))
+# Cascade mode: set CASCADE_THRESHOLD and/or CASCADE_TOP_K to run the paraphrase model
+# only on pairs the cheap context + TF-IDF channels rate as promising
+cascade_threshold = float(os.environ["CASCADE_THRESHOLD"]) if os.environ.get("CASCADE_THRESHOLD") else None
+cascade_top_k = int(os.environ.get("CASCADE_TOP_K", "0"))
+# BOILERPLATE_FRACTION (e.g. 0.5) skips text lines shared by more than that fraction of reports
+boilerplate_fraction = float(os.environ["BOILERPLATE_FRACTION"]) if os.environ.get("BOILERPLATE_FRACTION") else None
+# CONTEXT_DIM (e.g. 256) truncates the Matryoshka context embeddings; see benchmark.py --truncate-dims
+context_dim = int(os.environ["CONTEXT_DIM"]) if os.environ.get("CONTEXT_DIM") else None
+check_truncate_dim(context_dim)
+# Cohort mode always scores every pair with the default channels; options set
+# to anything else are not applied there
+COHORT_DEFAULTS = dict(candidate_top_k=0, minhash_weight=0.0, cascade_threshold=None, cascade_top_k=0,
+                       boilerplate_fraction=None)
+# Analyses run in the background; ANALYSIS_JOBS caps how many run at once on this server
+job_runner = get_job_runner(max_workers=int(os.environ.get("ANALYSIS_JOBS", "1")))
+
+
+def analyse_upload(*args, **kwargs):
+    # Finished jobs stay in memory (see JobRunner keep_finished); keep only what
+    # show_results displays, not the whole parsed cohort
+    return analyse_zip(*args, **kwargs).release_documents()
+
+
+def show_results(result):
+    for member_name, error in result.corpus.errors.items():
+        st.warning(f"Skipped {member_name}: {error}")
+    if result.updated_teams is not None:
+        st.info(f"{len(result.updated_teams)} new or changed submissions, {result.cohort_size} in the cohort in total.")
+
+    #st.success("Similarity calculations completed successfully!")
+    st.write(result.composite_pairs.to_dict())
+
+    if result.passage_matches:
+        st.subheader("Top matching passages in flagged pairs")
+        for team_pair, matches in result.passage_matches.items():
+            with st.expander(team_pair):
+                st.write(matches)
+    if result.unmatched_pairs:
+        st.info(f"No matching passages for {len(result.unmatched_pairs)} flagged pairs with a submission from an "
+                f"earlier upload of the cohort: {', '.join(result.unmatched_pairs)}")
+
+    # Where the time went, per stage and per document
+    with st.expander("Performance profile"):
+        profile = result.profiler.to_dict()
+        st.caption(f"Total {profile['total_wall_seconds']} s · peak RSS {profile['peak_rss_mb']} MB")
+        st.dataframe(profile["stages"])
+        st.dataframe(profile["documents"])
+        st.download_button(
+            label="Download profile (JSON)",
+            data=result.profiler.to_json(),
+            file_name="similarity_profile.json",
+            mime="application/json"
+        )
+
+    st.success("Similarity report created successfully!")
+
+    # The report is rendered in memory by the pipeline; nothing is read back from disk
+    if result.report is not None:
+        btn = st.download_button(
+            label="Download Similarity Report",
+            data=result.report,
+            file_name="similarity_report_final.pdf",
+            mime="application/pdf"
+        )
+    # All flagged pairs, for cohorts where the PDF only shows the top of the list
+    st.download_button(
+        label="Download flagged pairs (CSV)",
+        data=export_flagged_pairs(result.composite_pairs, threshold=FLAG_THRESHOLD, screened=result.screened_pairs),
+        file_name="flagged_pairs.csv",
+        mime="text/csv"
+    )
+    st.success("Analysis completed successfully!")
 
 
 def main():
@@ -32,91 +114,52 @@ def main():
 
     label = "Upload your zip file here"
     uploaded_file = st.file_uploader("Upload your zip file here", type="zip")
+    cohort_name = st.text_input("Cohort name (optional)", help="Analyse this upload together with earlier uploads of the same cohort. Only new or changed submissions are processed.").strip()
     
     if st.button("Analyze"):
         if uploaded_file is not None:
-            
-                
-
             st.success("ZIP file uploaded successfully!")
 
-            # Read the uploaded file as a zip file in memory
-            #Extract the zip file
-            extract_folder = "extracted_files"
-            os.makedirs(extract_folder, exist_ok=True)
-            zip_save_path = "uploaded.zip"
-            with zipfile.ZipFile(uploaded_file, "r") as zip_ref:
-                zip_ref.extractall(extract_folder)
-            #st.success(f"ZIP file extracted to folder: {extract_folder}")
-
-
-            pdf_list = [i for i in os.listdir("extracted_files") if i.endswith('.pdf')]
-            sorted_pdf_list = sorted(pdf_list)
-            print("Sorted PDF List:", sorted_pdf_list)
-
-
-            # using high-level embedding function
-            with st.spinner(text="In progress...", show_time=True):
-
-
-                team_embed_dict_context = create_embeddings_context_aware([os.path.join("extracted_files", pdf) for pdf in sorted_pdf_list], embed_model=embed_model)
-                team_embed_dict_tfidf = create_tfidf_embeddings([os.path.join("extracted_files", pdf) for pdf in sorted_pdf_list])
-                team_embed_dict_paraphrase = create_embeddings_paraphrase_aware([os.path.join("extracted_files", pdf) for pdf in sorted_pdf_list])
-                #st.success("Embeddings created successfully!") 
-
-                
-                
-                context_aware_similarity_dict = calculate_similarity(team_embed_dict_context, embed_model=embed_model)
-                tfidf_similarity_dict = calculate_tfidf_similarity(team_embed_dict_tfidf)
-                paraphrased_similarity_dict = calculate_similarity_paraphrase(team_embed_dict_paraphrase)
-                composite_similarity_dict = calculate_composite_similarity(context_aware_similarity_dict, tfidf_similarity_dict, paraphrased_similarity_dict)
-                
-                print("#########################################")
-                print(composite_similarity_dict)
-                print(tfidf_similarity_dict)
-                print(context_aware_similarity_dict)
-                print(paraphrased_similarity_dict)
-                print("#########################################")
-
-                #st.success("Similarity calculations completed successfully!")
-                st.write(composite_similarity_dict)
-                
-                
-                
-
-                
-                # Create and save the similarity report
-                #output_dir = "."
-                #os.makedirs(output_dir, exist_ok=True)
-                #report_path = os.path.join(output_dir, "similarity_report_final.pdf")
-                
-                report_path = "similarity_report_final.pdf"
-
-                # --- Logic to trigger the report generation ---
-                # This could be a button or any other Streamlit widget
-                #if st.button("Generate Similarity Report"):
-                # 1. Generate and save the report
-                save_similarity_report(composite_similarity_dict, report_path)
-                #print(os.listdir(".")) # For debugging: check if the file was created
-                st.success("Similarity report created successfully!")
-
-
-                # --- Logic to display the download button ---
-                # 2. Check if the report file exists before showing the download button
-                if os.path.exists(report_path):
-                    with open(report_path, "rb") as file:
-                        btn = st.download_button(
-                            label="Download Similarity Report",
-                            data=file,  # Pass the file object directly
-                            file_name="similarity_report_final.pdf",
-                            mime="application/pdf"
-                        )
-                st.success("Analysis completed successfully!")
+            # The same upload with the same settings maps to the same job, so repeat
+            # clicks and reruns reuse a running or finished analysis. In cohort mode
+            # the cohort's saved state is part of the key: once other uploads have
+            # changed it, the same ZIP is analysed again against the current cohort
+            data = uploaded_file.getvalue()
+            state_version = cohort_version(cohort_name) if cohort_name else None
+            options = dict(candidate_top_k=candidate_top_k, minhash_weight=minhash_weight,
+                           cascade_threshold=cascade_threshold, cascade_top_k=cascade_top_k,
+                           boilerplate_fraction=boilerplate_fraction)
+            if cohort_name:
+                # A cohort always scores all pairs with the default channels
+                ignored = [name for name, value in options.items() if value != COHORT_DEFAULTS[name]]
+                if ignored:
+                    st.warning(f"Not applied in cohort mode: {', '.join(ignored)}")
+                options = {}
+            else:
+                options["minhash_max_bucket_fraction"] = minhash_max_bucket_fraction
+            key = upload_key(data, cohort_name, state_version, *options.values(), context_dim, embed_model, paraphrase_model)
+            job_runner.submit(key, analyse_upload, io.BytesIO(data), workers=pdf_workers, source=uploaded_file.name,
+                              cache=embedding_cache, context_dim=context_dim, cohort_name=cohort_name,
+                              render_report=True, **options)
+            st.session_state["analysis_key"] = key
+
+    key = st.session_state.get("analysis_key")
+    job = job_runner.get(key) if key else None
+    if job is None:
+        return
+
+    if not job.finished:
+        st.progress(job.fraction, text=job.describe())
+        time.sleep(1)
+        st.rerun()
+    elif job.status == "failed":
+        st.error("Analysis failed. See the server log for details.")
+    else:
+        show_results(job.result)
 
 
 
 
 if __name__ == "__main__":
     main()
-    # Uncomment the line below to run the app
-    
+    # Uncomment the line below to run the app
\ No newline at end of file
@@ -0,0 +1,191 @@
+import re
+import zlib
+import numpy as np
+from similarity_engine import PairScores
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_BASE = np.uint64(1000003)
+# LSH buckets holding more than this fraction of the documents are skipped: a
+# band shared by that many reports is course template text, not copying, and its
+# pairs would grow quadratically with the cohort. Relative, so a solution copied
+# by a fixed number of teams stays visible however large the cohort is...
+DEFAULT_MAX_BUCKET_FRACTION = 0.05
+# ...and buckets of up to this many documents are always kept, so small cohorts
+# do not lose a ring of copies to the fraction
+MIN_BUCKET_CAP = 10
+
+
+def bucket_cap(n_documents, max_fraction=DEFAULT_MAX_BUCKET_FRACTION, min_documents=MIN_BUCKET_CAP):
+    # Largest LSH bucket still used for a cohort of n_documents; None keeps all
+    if max_fraction is None:
+        return None
+    return max(min_documents, int(max_fraction * n_documents))
+
+
+def shingle_hashes(text, shingle_size=5):
+    """
+    Stable 32-bit hashes of the distinct word shingles of a text.
+
+    Words are lower-cased \\w+ tokens hashed with CRC32, and each run of
+    shingle_size consecutive words is combined with a polynomial hash, so the
+    result is the same in every process and Python version (unlike hash()).
+
+    Returns:
+    - np.ndarray of unique uint64 values below 2**32; empty if the text has
+      fewer than shingle_size words.
+    """
+    tokens = _WORD.findall(text.lower())
+    if len(tokens) < shingle_size:
+        return np.zeros(0, dtype=np.uint64)
+
+    token_hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                               dtype=np.uint64, count=len(tokens))
+    n_shingles = len(tokens) - shingle_size + 1
+    combined = np.zeros(n_shingles, dtype=np.uint64)
+    with np.errstate(over="ignore"):  # uint64 wrap-around is part of the hash
+        for offset in range(shingle_size):
+            combined = combined * _SHINGLE_BASE + token_hashes[offset:offset + n_shingles]
+    return np.unique(combined & _MAX_HASH)
+
+
+class MinHashIndex:
+    """
+    MinHash signatures of word shingles with LSH banding.
+
+    Each document is reduced to num_perm minimum hash values in one pass over its
+    text, so memory is num_perm * 4 bytes per document whatever its length. The
+    fraction of equal signature positions estimates the Jaccard similarity of two
+    documents' shingle sets. LSH splits signatures into bands; documents sharing
+    any band become candidates, which finds near-duplicates without comparing
+    every pair. With the defaults (32 bands of 4 rows) pairs above roughly 0.4
+    Jaccard are very likely to be found.
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.teams = []
+        self._signatures = []
+
+    def __len__(self):
+        return len(self.teams)
+
+    def signature(self, text, block_size=4096):
+        """
+        Returns:
+        - uint32 array of num_perm minima. A text without shingles gets all
+          2**32 - 1, which matches nothing (see estimate).
+        """
+        hashes = shingle_hashes(text, self.shingle_size)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for start in range(0, len(hashes), block_size):
+                block = hashes[start:start + block_size]
+                permuted = ((np.outer(self._a, block) + self._b[:, None]) % _MERSENNE_PRIME) & _MAX_HASH
+                np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+    def add(self, team, text):
+        self.teams.append(team)
+        self._signatures.append(self.signature(text))
+
+    @property
+    def signatures(self):
+        if not self._signatures:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return np.vstack(self._signatures)
+
+    def candidate_pairs(self, max_fraction=DEFAULT_MAX_BUCKET_FRACTION, min_documents=MIN_BUCKET_CAP):
+        """
+        Pairs of documents that share at least one LSH band.
+
+        Parameters:
+        - max_fraction (float): Skip buckets holding more than this fraction of
+          the documents, e.g. bands made entirely of shared template text...
+        - min_documents (int): ...unless they hold at most this many documents.
+          None for max_fraction keeps every bucket. Bounded, a band yields at
+          most about n * bucket_cap(n) / 2 pairs.
+
+        Returns:
+        - PairScores of the unique candidate pairs with their estimated Jaccard.
+        """
+        signatures = self.signatures
+        n = len(self.teams)
+        max_bucket = bucket_cap(n, max_fraction, min_documents)
+        empty = (signatures == np.uint32(_MAX_HASH)).all(axis=1)
+        rows_per_band = self.num_perm // self.bands
+        keys = []
+
+        for band in range(self.bands):
+            band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            _, bucket = np.unique(band_values, axis=0, return_inverse=True)
+            bucket = bucket.ravel()
+            bucket[empty] = -1
+            order = np.argsort(bucket, kind="stable")
+            sorted_buckets = bucket[order]
+            boundaries = np.flatnonzero(np.diff(sorted_buckets)) + 1
+            for members in np.split(order, boundaries):
+                if len(members) < 2 or bucket[members[0]] < 0:
+                    continue
+                if max_bucket is not None and len(members) > max_bucket:
+                    continue
+                left, right = np.triu_indices(len(members), 1)
+                i, j = members[left].astype(np.int64), members[right].astype(np.int64)
+                keys.append(np.minimum(i, j) * n + np.maximum(i, j))
+
+        if not keys:
+            return PairScores(self.teams, [], [], [])
+        keys = np.unique(np.concatenate(keys))
+        rows, cols = keys // n, keys % n
+        return PairScores(self.teams, rows, cols, self._estimate(signatures, rows, cols))
+
+    def score_pairs(self, pair_teams, block_size=65536):
+        """
+        Estimated Jaccard similarity for the given pairs, e.g. another channel's.
+
+        Pairs that involve a team not in the index are skipped.
+
+        Returns:
+        - PairScores over pair_teams.teams.
+        """
+        position = {team: i for i, team in enumerate(self.teams)}
+        lookup = np.array([position.get(team, -1) for team in pair_teams.teams], dtype=np.int64)
+        if len(lookup) == 0:
+            return PairScores(pair_teams.teams, [], [], [])
+        local_rows = lookup[pair_teams.rows]
+        local_cols = lookup[pair_teams.cols]
+        keep = (local_rows >= 0) & (local_cols >= 0)
+
+        signatures = self.signatures
+        scores = np.zeros(int(keep.sum()), dtype=np.float32)
+        local_rows, local_cols = local_rows[keep], local_cols[keep]
+        for start in range(0, len(local_rows), block_size):
+            stop = min(start + block_size, len(local_rows))
+            scores[start:stop] = self._estimate(signatures, local_rows[start:stop], local_cols[start:stop])
+
+        return PairScores(pair_teams.teams, pair_teams.rows[keep], pair_teams.cols[keep], scores)
+
+    @staticmethod
+    def _estimate(signatures, rows, cols):
+        left, right = signatures[rows], signatures[cols]
+        # Positions that are still at the sentinel come from empty documents
+        equal = (left == right) & (left != np.uint32(_MAX_HASH))
+        return equal.mean(axis=1).astype(np.float32)
+
+
+def build_minhash_index(documents, num_perm=128, bands=32, shingle_size=5):
+    """
+    MinHash index over {team_name: ExtractedDocument}, one document at a time.
+    """
+    index = MinHashIndex(num_perm=num_perm, bands=bands, shingle_size=shingle_size)
+    for team_name, document in documents.items():
+        index.add(team_name, document.text)
+    return index
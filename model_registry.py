@@ -0,0 +1,81 @@
+import os
+import threading
+
+# Process-wide: Streamlit re-executes main.py on every rerun but keeps imported
+# modules, so models loaded here are shared by all reruns and sessions.
+_models = {}
+_lock = threading.Lock()
+
+# Inference backend of the transformer encoders:
+# - "torch": plain PyTorch (the baseline),
+# - "torch-int8": PyTorch with nn.Linear weights dynamically quantised to int8,
+# - "onnx": ONNX Runtime via sentence-transformers (needs optimum[onnxruntime]);
+#   ENCODER_ONNX_FILE picks a specific graph, e.g. onnx/model_qint8_avx512_vnni.onnx.
+# Check the effect on scores with backend_parity.py before switching.
+BACKENDS = ("torch", "torch-int8", "onnx")
+DEFAULT_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+# Intra-op threads for PyTorch / ONNX Runtime; unset keeps the library default
+ENCODER_THREADS = int(os.environ["ENCODER_THREADS"]) if os.environ.get("ENCODER_THREADS") else None
+
+
+def resolve_backend(embed_model, backend=None):
+    """
+    Backend actually used for embed_model.
+
+    Static-embedding models (e.g. static-similarity-mrl-multilingual-v1) are a
+    token lookup table with no transformer layers to export or quantise, so
+    they always run on "torch".
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    if "static-" in embed_model:
+        return "torch"
+    return backend
+
+
+def _load_model(embed_model, device, backend):
+    # Imported lazily so importing this module never pulls in torch or weights
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if ENCODER_THREADS:
+        torch.set_num_threads(ENCODER_THREADS)
+
+    if backend == "onnx":
+        model_kwargs = {}
+        if os.environ.get("ENCODER_ONNX_FILE"):
+            model_kwargs["file_name"] = os.environ["ENCODER_ONNX_FILE"]
+        if ENCODER_THREADS:
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = ENCODER_THREADS
+            model_kwargs["session_options"] = session_options
+        return SentenceTransformer(embed_model, device=device, backend="onnx", model_kwargs=model_kwargs)
+
+    model = SentenceTransformer(embed_model, device=device)
+    if backend == "torch-int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_model(embed_model, device="cpu", backend=None):
+    """
+    Return the SentenceTransformer for embed_model, loading it on first use only.
+
+    backend defaults to ENCODER_BACKEND; see resolve_backend.
+    """
+    backend = resolve_backend(embed_model, backend)
+    key = (embed_model, device, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _load_model(embed_model, device, backend)
+            _models[key] = model
+
+    return model
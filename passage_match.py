@@ -0,0 +1,129 @@
+import numpy as np
+
+# Composite score from which a pair counts as "Possible Risk" in the report
+FLAG_THRESHOLD = 0.80
+
+
+class ChunkStore:
+    """
+    Per-team chunk embeddings with page/offset metadata, kept for passage matching.
+
+    Vectors are stored as float16 by default (half the memory of float32) and are
+    only widened to float32 one block at a time while matching.
+    """
+
+    def __init__(self, dtype=np.float16):
+        self.dtype = dtype
+        self._vectors = {}
+        self._documents = {}
+
+    def __contains__(self, team_name):
+        return team_name in self._vectors
+
+    def add(self, team_name, chunk_embeddings, document):
+        self._vectors[team_name] = np.asarray(chunk_embeddings, dtype=self.dtype)
+        self._documents[team_name] = document
+
+    def vectors(self, team_name):
+        return self._vectors[team_name]
+
+    def passage(self, team_name, chunk_index):
+        document = self._documents[team_name]
+        return {
+            "page": int(document.chunk_pages[chunk_index]) + 1,
+            "offset": int(document.chunk_offsets[chunk_index]),
+            "text": document.chunks[chunk_index],
+        }
+
+
+def _top_chunk_pairs(vectors_a, vectors_b, top_k, block_size):
+    # Running top-k over a blocked chunk x chunk similarity matrix; at most
+    # block_size x block_size scores exist at any time
+    best_scores = np.zeros(0, dtype=np.float32)
+    best_a = np.zeros(0, dtype=np.int64)
+    best_b = np.zeros(0, dtype=np.int64)
+
+    for start_a in range(0, len(vectors_a), block_size):
+        block_a = vectors_a[start_a:start_a + block_size].astype(np.float32)
+        for start_b in range(0, len(vectors_b), block_size):
+            block_b = vectors_b[start_b:start_b + block_size].astype(np.float32)
+            sims = (block_a @ block_b.T).ravel()
+
+            k = min(top_k, len(sims))
+            top = np.argpartition(-sims, k - 1)[:k]
+            rows, cols = np.divmod(top, block_b.shape[0])
+
+            best_scores = np.concatenate([best_scores, sims[top]])
+            best_a = np.concatenate([best_a, rows + start_a])
+            best_b = np.concatenate([best_b, cols + start_b])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_scores, best_a, best_b = best_scores[keep], best_a[keep], best_b[keep]
+
+    order = np.argsort(-best_scores)
+    return best_scores[order], best_a[order], best_b[order]
+
+
+def match_passages(store, team_a, team_b, top_k=5, block_size=512):
+    """
+    Top matching chunk pairs between two teams' reports.
+
+    Returns:
+    - list of dicts {"score", "team_a", "team_b"}, where team_a/team_b each hold the
+      passage's page (1-based), character offset within the page and text.
+    """
+    vectors_a = store.vectors(team_a)
+    vectors_b = store.vectors(team_b)
+    if len(vectors_a) == 0 or len(vectors_b) == 0:
+        return []
+
+    scores, chunks_a, chunks_b = _top_chunk_pairs(vectors_a, vectors_b, top_k, block_size)
+    return [
+        {
+            "score": round(float(score), 2),
+            "team_a": store.passage(team_a, i),
+            "team_b": store.passage(team_b, j),
+        }
+        for score, i, j in zip(scores, chunks_a, chunks_b)
+    ]
+
+
+def _flagged_indices(pairs, threshold=FLAG_THRESHOLD, max_pairs=20):
+    # Indices of the highest-scoring pairs at or above threshold, best first
+    flagged = np.flatnonzero(pairs.scores >= threshold)
+    return flagged[np.argsort(-pairs.scores[flagged])][:max_pairs]
+
+
+def flagged_teams(pairs, threshold=FLAG_THRESHOLD, max_pairs=20):
+    """
+    Teams in the pairs match_flagged_pairs will match, i.e. the only documents
+    whose chunk vectors a ChunkStore needs to hold.
+    """
+    flagged = _flagged_indices(pairs, threshold, max_pairs)
+    return {pairs.teams[i] for i in np.concatenate([pairs.rows[flagged], pairs.cols[flagged]])}
+
+
+def match_flagged_pairs(store, pairs, threshold=FLAG_THRESHOLD, max_pairs=20, top_k=5, block_size=512, skipped=None):
+    """
+    Run match_passages for the highest-scoring pairs at or above threshold.
+
+    Parameters:
+    - pairs (PairScores): Usually the composite scores.
+    - skipped (list): Optional; the labels of flagged pairs with a team missing
+      from store (and hence no matches) are appended to it.
+
+    Returns:
+    - dict: {'Team A and Team B': [matches, ...]}, highest pair score first.
+    """
+    flagged = _flagged_indices(pairs, threshold, max_pairs)
+
+    matches = {}
+    for i, label in zip(flagged, pairs.labels(flagged)):
+        team_a = pairs.teams[pairs.rows[i]]
+        team_b = pairs.teams[pairs.cols[i]]
+        if team_a in store and team_b in store:
+            matches[label] = match_passages(store, team_a, team_b, top_k=top_k, block_size=block_size)
+        elif skipped is not None:
+            skipped.append(label)
+
+    return matches
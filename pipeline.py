@@ -0,0 +1,325 @@
+import logging
+import numpy as np
+from calculate_similarity import (calculate_composite_pairs, calculate_similarity_for_pairs, calculate_similarity_pairs,
+                                  composite_weights, find_candidate_pairs, find_near_duplicate_pairs,
+                                  select_cascade_pairs)
+from boilerplate import find_boilerplate, remove_boilerplate
+from cohort_state import CohortState, cohort_lock, cohort_path, update_cohort
+from create_embeddings import create_document_embeddings, create_tfidf_embeddings
+from create_report import render_similarity_report
+from document_store import extract_documents_from_directory, extract_documents_from_zip
+from embed import check_truncate_dim
+from passage_match import ChunkStore, flagged_teams, match_flagged_pairs
+from profiling import Profiler, peak_rss_mb
+from minhash import DEFAULT_MAX_BUCKET_FRACTION, bucket_cap
+from similarity_engine import aligned_scores, union_pairs
+
+embed_model = 'sentence-transformers/static-similarity-mrl-multilingual-v1'
+paraphrase_model = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisResult:
+    """
+    Everything one analysis run produces.
+
+    Attributes:
+    - corpus (Corpus): The parsed upload, including per-file errors.
+    - channel_pairs (dict): {"context" | "tfidf" | "paraphrase": PairScores}, plus
+      "minhash" when the MinHash channel ran.
+    - composite_pairs (PairScores): Weighted blend of the three channels.
+    - passage_matches (dict): Top matching passages of flagged pairs.
+    - unmatched_pairs (list): Labels of flagged pairs without passage matches
+      because a team's report is not in this upload (cohort mode: earlier members).
+    - screened_pairs (np.ndarray): In cascade mode, a boolean mask over
+      composite_pairs of the pairs screened out of the paraphrase channel, whose
+      composite blends context and TF-IDF only; else None.
+    - updated_teams (list): Teams added or changed in cohort mode, else None.
+    - cohort_size (int): Documents in the cohort after the update, else None.
+    - report (bytes): The rendered PDF report, if requested.
+    - report_path (str): Where the PDF report was written, if requested.
+    - profiler (Profiler): Per-stage and per-document timings of this run.
+    """
+
+    def __init__(self, corpus, channel_pairs, composite_pairs, passage_matches,
+                 updated_teams=None, cohort_size=None, report=None, report_path=None, profiler=None, unmatched_pairs=None,
+                 screened_pairs=None):
+        self.corpus = corpus
+        self.channel_pairs = channel_pairs
+        self.composite_pairs = composite_pairs
+        self.passage_matches = passage_matches
+        self.unmatched_pairs = unmatched_pairs or []
+        self.screened_pairs = screened_pairs
+        self.updated_teams = updated_teams
+        self.cohort_size = cohort_size
+        self.report = report
+        self.report_path = report_path
+        self.profiler = profiler
+
+    def release_documents(self):
+        """
+        Drop the parsed documents (every page and chunk) and the per-channel
+        scores, keeping the errors, composite scores, passages, report and profile,
+        e.g. for results that stay in memory after the run.
+        """
+        self.corpus.documents = {}
+        self.channel_pairs = {}
+        return self
+
+
+def _no_progress(stage, done=None, total=None):
+    pass
+
+
+def _labelled(progress, label):
+    # Re-label a helper's progress calls, e.g. "Encoding" -> "Encoding (context)"
+    return lambda stage, done=None, total=None: progress(f"{stage} ({label})", done, total)
+
+
+def run_analysis(corpus, embed_model=embed_model, paraphrase_model=paraphrase_model, cache=None,
+                 candidate_top_k=0, minhash_weight=0.0, minhash_max_bucket_fraction=DEFAULT_MAX_BUCKET_FRACTION, cascade_threshold=None, cascade_top_k=0, boilerplate_fraction=None,
+                 context_dim=None, cohort_name=None, render_report=False, report_path=None, progress=None, profiler=None):
+    """
+    Run the three similarity channels, the composite score and passage matching on a corpus.
+
+    Parameters:
+    - corpus (Corpus): Output of document_store.extract_documents_from_zip.
+    - cache (EmbeddingCache): Optional embedding cache shared between runs.
+    - candidate_top_k (int): If > 0, only score each team's nearest neighbours,
+      plus every near-duplicate pair found by MinHash LSH. Not supported in
+      cohort mode.
+    - minhash_weight (float): If > 0 (and < 1), add the MinHash Jaccard estimate
+      to the composite with this weight; the other channels' weights are scaled
+      down by 1 - minhash_weight (see composite_weights), and the report lists
+      the weights used. Not supported in cohort mode.
+    - minhash_max_bucket_fraction (float): LSH buckets holding more than this
+      fraction of the documents (shared template text, see minhash.bucket_cap)
+      yield no near-duplicate pairs; None keeps them all.
+    - cascade_threshold (float), cascade_top_k (int): Cascade mode, on if either is
+      set. Context and TF-IDF score the pairs first; only pairs whose blend of
+      the two is >= cascade_threshold or among the cascade_top_k best (plus
+      MinHash near-duplicates) get paraphrase embeddings and scores. Screened-out
+      pairs have no paraphrase score, so their composite renormalises the context
+      and TF-IDF weights. Not supported in cohort mode.
+    - boilerplate_fraction (float): If given, text lines found (after normalisation)
+      in more than this fraction of the documents are treated as course template
+      text and cut from the chunks both transformer channels encode. Not
+      supported in cohort mode.
+    - context_dim (int): If given (must be positive), truncate the context (Matryoshka MRL) embeddings
+      to this many dimensions for encoding, caching, cohort storage and scoring.
+    - cohort_name (str): If given, merge into that persisted cohort and only
+      process new or changed submissions. The cohort always scores all pairs
+      with the three default channels, so candidate_top_k, minhash_weight,
+      cascade and boilerplate_fraction raise ValueError. Passages are only
+      matched for flagged pairs whose reports are both in this upload; the rest
+      are listed in result.unmatched_pairs.
+    - render_report (bool): Render the PDF report in memory (result.report).
+    - report_path (str): If given, also write the PDF report there.
+    - progress (callable): Optional; called as progress(stage, done, total).
+    - profiler (Profiler): Optional; a new one is used otherwise. Returned on the
+      result either way.
+    """
+    progress = progress or _no_progress
+    profiler = profiler or Profiler()
+    cascade = cascade_threshold is not None or cascade_top_k > 0
+    if cohort_name:
+        unsupported = [name for name, used in (("candidate_top_k", candidate_top_k > 0), ("minhash_weight", minhash_weight > 0),
+                                               ("cascade", cascade), ("boilerplate_fraction", boilerplate_fraction is not None))
+                       if used]
+        if unsupported:
+            raise ValueError(f"Not supported in cohort mode: {', '.join(unsupported)}")
+    weights = composite_weights(minhash_weight)
+    check_truncate_dim(context_dim)
+    documents = corpus.documents
+    embed_documents = documents  # what the transformer channels encode
+    minhash_index = None
+    updated_teams = None
+    cohort_size = None
+
+    for document in documents.values():
+        profiler.record_document(document.team_name, **document.stats)
+
+    if cohort_name:
+        # Incremental mode: only new or changed submissions are embedded and
+        # only their rows of the stored score matrices are recomputed
+        path = cohort_path(cohort_name)
+        with profiler.stage("Cohort update", items=len(documents)) as record, cohort_lock(path):
+            state = CohortState.load(path)
+            timings = {}
+            updated_teams = update_cohort(state, documents, embed_model, paraphrase_model,
+                                          cache=cache, progress=progress, context_dim=context_dim, timings=timings)
+            progress("Saving cohort state")
+            state.save()
+            record["updated_documents"] = len(updated_teams)
+        cohort_size = len(state)
+        for channel, channel_timings in timings.items():
+            profiler.record_encoding(channel, channel_timings)
+        channel_pairs = {channel: state.pairs(channel) for channel in ("context", "tfidf", "paraphrase")}
+    else:
+        # Template lines shared by most reports are removed before encoding; the
+        # encoders then only see (and score on) each team's own text
+        if boilerplate_fraction is not None:
+            progress("Detecting boilerplate")
+            with profiler.stage("Boilerplate detection", items=len(documents)) as record:
+                boilerplate = find_boilerplate(documents, max_fraction=boilerplate_fraction)
+                embed_documents = remove_boilerplate(documents, boilerplate)
+                record["boilerplate_lines"] = len(boilerplate)
+                record["lines_removed"] = sum(d.stats.get("boilerplate_lines", 0) for d in embed_documents.values())
+                record["chunks_dropped"] = sum(d.stats.get("boilerplate_chunks", 0) for d in embed_documents.values())
+
+        timings = {}
+        with profiler.stage("Encoding (context)", items=len(documents), model=embed_model, dim=context_dim) as record:
+            team_embed_dict_context = create_document_embeddings(embed_documents, embed_model, cache=cache,
+                                                                 progress=_labelled(progress, "context"), stats=record,
+                                                                 truncate_dim=context_dim, timings=timings)
+        profiler.record_encoding("context", timings)
+        progress("TF-IDF")
+        with profiler.stage("TF-IDF fit/transform", items=len(documents)):
+            team_embed_dict_tfidf = create_tfidf_embeddings(None, documents=documents)
+
+        near_duplicates = None
+        if candidate_top_k > 0 or minhash_weight > 0 or cascade:
+            progress("MinHash signatures")
+            with profiler.stage("MinHash signatures + LSH", items=len(documents)) as record:
+                near_duplicates, minhash_index = find_near_duplicate_pairs(documents,
+                                                                           max_bucket_fraction=minhash_max_bucket_fraction)
+                record["candidates"] = len(near_duplicates)
+                record["max_bucket"] = bucket_cap(len(documents), minhash_max_bucket_fraction)
+
+        # Compact pair arrays per channel; string labels are only built for display
+        progress("Scoring pairs")
+        if candidate_top_k > 0:
+            with profiler.stage("Candidate search (context)") as record:
+                # Near-duplicates always reach the transformer channels, even when
+                # they are not among a team's nearest neighbours
+                candidates = union_pairs(find_candidate_pairs(team_embed_dict_context, top_k=candidate_top_k),
+                                         near_duplicates)
+                context_aware_pairs = calculate_similarity_for_pairs(team_embed_dict_context, candidates)
+                record["items"] = len(context_aware_pairs)
+            with profiler.stage("Pairwise scoring (tfidf)", items=len(context_aware_pairs)):
+                tfidf_pairs = calculate_similarity_for_pairs(team_embed_dict_tfidf, context_aware_pairs)
+        else:
+            with profiler.stage("Pairwise scoring (context)") as record:
+                context_aware_pairs = calculate_similarity_pairs(team_embed_dict_context)
+                record["items"] = len(context_aware_pairs)
+            with profiler.stage("Pairwise scoring (tfidf)", items=len(context_aware_pairs)):
+                tfidf_pairs = calculate_similarity_pairs(team_embed_dict_tfidf)
+
+        # The paraphrase channel is by far the most expensive; in cascade mode it
+        # only sees the pairs the cheap channels (and MinHash) found promising
+        paraphrase_documents = embed_documents
+        paraphrase_candidates = context_aware_pairs if candidate_top_k > 0 else None
+        if cascade:
+            progress("Cascade screening")
+            with profiler.stage("Cascade screening", items=len(context_aware_pairs)) as record:
+                paraphrase_candidates = union_pairs(
+                    select_cascade_pairs(context_aware_pairs, tfidf_pairs, threshold=cascade_threshold, top_k=cascade_top_k),
+                    near_duplicates)
+                involved = np.unique(np.concatenate([paraphrase_candidates.rows, paraphrase_candidates.cols]))
+                involved_teams = {paraphrase_candidates.teams[i] for i in involved}
+                paraphrase_documents = {team: document for team, document in embed_documents.items()
+                                        if team in involved_teams}
+                record["pairs_kept"] = len(paraphrase_candidates)
+                record["documents_kept"] = len(paraphrase_documents)
+
+        timings = {}
+        with profiler.stage("Encoding (paraphrase)", items=len(paraphrase_documents), model=paraphrase_model) as record:
+            team_embed_dict_paraphrase = create_document_embeddings(paraphrase_documents, paraphrase_model, cache=cache,
+                                                                    progress=_labelled(progress, "paraphrase"), stats=record,
+                                                                    timings=timings)
+        profiler.record_encoding("paraphrase", timings)
+        if paraphrase_candidates is not None:
+            with profiler.stage("Pairwise scoring (paraphrase)", items=len(paraphrase_candidates)):
+                paraphrased_pairs = calculate_similarity_for_pairs(team_embed_dict_paraphrase, paraphrase_candidates)
+        else:
+            with profiler.stage("Pairwise scoring (paraphrase)", items=len(context_aware_pairs)):
+                paraphrased_pairs = calculate_similarity_pairs(team_embed_dict_paraphrase)
+        channel_pairs = {"context": context_aware_pairs, "tfidf": tfidf_pairs, "paraphrase": paraphrased_pairs}
+        if minhash_weight > 0:
+            with profiler.stage("Pairwise scoring (minhash)", items=len(context_aware_pairs)):
+                channel_pairs["minhash"] = minhash_index.score_pairs(context_aware_pairs)
+
+    progress("Composite scoring")
+    with profiler.stage("Composite scoring") as record:
+        composite_pairs = calculate_composite_pairs(channel_pairs["context"], channel_pairs["tfidf"], channel_pairs["paraphrase"],
+                                                    weights=weights, minhash_pairs=channel_pairs.get("minhash"))
+        record["items"] = len(composite_pairs)
+        # Screened-out pairs blend context and TF-IDF only, so exports and the
+        # report mark them as not comparable with pairs the paraphrase model scored
+        screened_pairs = None
+        if cascade:
+            screened_pairs = np.isnan(aligned_scores(channel_pairs["paraphrase"], composite_pairs))
+            record["screened_pairs"] = int(screened_pairs.sum())
+
+    # Localise the overlapping passages of the most similar pairs. Chunk vectors
+    # are fetched for the documents of those pairs only, from the embedding cache
+    # (just filled by the encoders) or by re-encoding them. In cohort mode only
+    # this upload's reports are at hand, so pairs with earlier members are skipped
+    progress("Matching passages")
+    with profiler.stage("Passage matching") as record:
+        teams = flagged_teams(composite_pairs)
+        chunk_store = ChunkStore()
+        create_document_embeddings({team: document for team, document in embed_documents.items() if team in teams},
+                                   embed_model, cache=cache, chunk_store=chunk_store, truncate_dim=context_dim,
+                                   stats=record)
+        unmatched_pairs = []
+        passage_matches = match_flagged_pairs(chunk_store, composite_pairs, skipped=unmatched_pairs)
+        record["items"] = len(passage_matches)
+        record["pairs_without_passages"] = len(unmatched_pairs)
+    if unmatched_pairs:
+        logger.info("No passage matches for %d flagged pairs whose reports are not all in this upload",
+                    len(unmatched_pairs))
+
+    report = None
+    if render_report or report_path is not None:
+        progress("Rendering report")
+        with profiler.stage("Report rendering", items=min(15, len(composite_pairs))):
+            report = render_similarity_report(composite_pairs, weights=weights, screened=screened_pairs)
+            if report_path is not None:
+                with open(report_path, "wb") as f:
+                    f.write(report)
+
+    progress("Done")
+    # The same figures are in result.profiler; logged for servers that collect logs
+    logger.info("Analysed %d documents in %ss; peak RSS %s MB", len(documents), profiler.total_wall_seconds(), peak_rss_mb())
+    return AnalysisResult(corpus, channel_pairs, composite_pairs, passage_matches,
+                          updated_teams=updated_teams, cohort_size=cohort_size, report=report,
+                          report_path=report_path,
+                          profiler=profiler, unmatched_pairs=unmatched_pairs, screened_pairs=screened_pairs)
+
+
+def _ingest(stage_name, extract, profiler, workers):
+    with profiler.stage(stage_name, workers=workers) as record:
+        corpus = extract()
+        record["items"] = len(corpus)
+        record["failed"] = len(corpus.errors)
+        # Summed over documents, i.e. CPU-side work spread across the worker pool
+        record["parse_seconds_total"] = round(sum(d.stats.get("parse_seconds", 0) for d in corpus.documents.values()), 4)
+        record["chunk_seconds_total"] = round(sum(d.stats.get("chunk_seconds", 0) for d in corpus.documents.values()), 4)
+        record["cpu_seconds_total"] = round(sum(d.stats.get("cpu_seconds", 0) for d in corpus.documents.values()), 4)
+    return corpus
+
+
+def analyse_zip(zip_file, workers=None, source=None, progress=None, profiler=None, **options):
+    """
+    Ingest a ZIP of team reports and run the full analysis; see run_analysis for options.
+    """
+    progress = progress or _no_progress
+    profiler = profiler or Profiler()
+    corpus = _ingest("ZIP ingestion (parse + chunk)",
+                     lambda: extract_documents_from_zip(zip_file, workers=workers, source=source, progress=progress),
+                     profiler, workers)
+    return run_analysis(corpus, progress=progress, profiler=profiler, **options)
+
+
+def analyse_directory(directory, workers=None, progress=None, profiler=None, **options):
+    """
+    Ingest a directory of team report PDFs and run the full analysis; see run_analysis for options.
+    """
+    progress = progress or _no_progress
+    profiler = profiler or Profiler()
+    corpus = _ingest("Directory ingestion (parse + chunk)",
+                     lambda: extract_documents_from_directory(directory, workers=workers, progress=progress),
+                     profiler, workers)
+    return run_analysis(corpus, progress=progress, profiler=profiler, **options)
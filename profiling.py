@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _rusage_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024, 1)
+
+
+def peak_rss_mb():
+    # High-water mark of this process since it started
+    return _rusage_mb(resource.RUSAGE_SELF) if resource is not None else None
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _children_cpu_seconds():
+    # CPU time of finished child processes, e.g. the PDF parsing pool
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, memory and item counts per pipeline stage, plus
+    per-document statistics.
+
+    cpu_seconds covers this process and any child processes that finished during
+    the stage, so it includes encoder threads and the PDF parsing pool. It is
+    process-wide: with several analyses running at once (ANALYSIS_JOBS > 1) their
+    work, parse pools included, is counted in each other's stages. thread_cpu_seconds
+    is the CPU time of the thread running the stage only, which is unaffected by
+    other jobs but misses work done in pools and library threads. The per-document
+    cpu_seconds (parsing and chunking) are per-thread too. peak_rss_mb is the
+    process-wide high-water mark at the end of the stage, so a jump between two
+    stages shows which one raised it.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.documents = []
+        self._document_records = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, items=None, **details):
+        """
+        Time a block. The yielded dict can be updated inside the block, e.g. to set
+        "items" once the count is known.
+        """
+        record = {"stage": name, "items": items}
+        record.update(details)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time() + _children_cpu_seconds()
+        thread_cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu_seconds"] = round(time.process_time() + _children_cpu_seconds() - cpu_start, 4)
+            record["thread_cpu_seconds"] = round(time.thread_time() - thread_cpu_start, 4)
+            record["rss_mb"] = current_rss_mb()
+            record["peak_rss_mb"] = peak_rss_mb()
+            if record["items"] and record["wall_seconds"] > 0:
+                record["items_per_second"] = round(record["items"] / record["wall_seconds"], 2)
+            with self._lock:
+                self.stages.append(record)
+
+    def record_document(self, team_name, **stats):
+        # Later calls for the same team add to its record, e.g. encoding times
+        with self._lock:
+            record = self._document_records.get(team_name)
+            if record is None:
+                record = self._document_records[team_name] = {"team": team_name}
+                self.documents.append(record)
+            record.update(stats)
+
+    def record_encoding(self, channel, timings):
+        # timings: {team_name: seconds} from create_document_embeddings
+        for team_name, seconds in timings.items():
+            self.record_document(team_name, **{f"{channel}_encode_seconds": round(seconds, 4)})
+
+    def total_wall_seconds(self):
+        return round(sum(record["wall_seconds"] for record in self.stages), 4)
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "total_wall_seconds": self.total_wall_seconds(),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+            "documents": self.documents,
+        }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
@@ -0,0 +1,383 @@
+import numpy as np
+from scipy.sparse import issparse, vstack as sparse_vstack
+
+
+def pair_label(current_team, other_team):
+    return f"Team {current_team} and Team {other_team}"
+
+
+def pair_key(label):
+    """
+    Order-independent key of a pair_label string: the sorted team names, so
+    "Team A and Team B" and "Team B and Team A" match. Labels in any other
+    format are their own key.
+    """
+    if label.startswith("Team ") and " and Team " in label:
+        current_team, other_team = label[len("Team "):].split(" and Team ", 1)
+        return tuple(sorted((current_team, other_team)))
+    return label
+
+
+class PairScores:
+    """
+    Compact pairwise similarity result for one channel.
+
+    Attributes:
+    - teams (list): Team names; rows and cols index into this list.
+    - rows, cols (np.ndarray): int32 team indices of each pair, with rows < cols.
+    - scores (np.ndarray): float32 similarity of each pair.
+
+    String labels are only built on demand (labels / to_dict), so the arrays
+    stay small even for hundreds of thousands of pairs.
+    """
+
+    def __init__(self, teams, rows, cols, scores):
+        self.teams = list(teams)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def labels(self, index=None):
+        if index is None:
+            index = range(len(self.scores))
+        return [pair_label(self.teams[self.rows[i]], self.teams[self.cols[i]]) for i in index]
+
+    def to_dict(self, decimals=2):
+        # Same shape as the legacy {'Team A and Team B': score} dicts
+        return {label: round(float(score), decimals) for label, score in zip(self.labels(), self.scores)}
+
+
+def stack_embeddings(embeddings_dict):
+    """
+    Stack {team_name: 1 x d vector} into one matrix; sparse rows stay sparse.
+
+    Returns:
+    - (teams, matrix)
+    """
+    teams = list(embeddings_dict.keys())
+    vectors = [embeddings_dict[team] for team in teams]
+    if not vectors:
+        return teams, np.zeros((0, 0), dtype=np.float32)
+
+    if issparse(vectors[0]):
+        return teams, sparse_vstack(vectors).tocsr()
+
+    matrix = np.vstack([np.asarray(vector, dtype=np.float32).reshape(1, -1) for vector in vectors])
+    return teams, matrix
+
+
+def normalize_rows(matrix):
+    # L2-normalise every row; all-zero rows are left as zeros (score 0 with everything)
+    if issparse(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return matrix.multiply(1.0 / norms[:, None]).tocsr()
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Every kernel below accepts either a matrix (dense or sparse; normalised on entry)
+# or a block source such as embedding_store.EmbeddingStore: an object with
+# .shape, .dense(start, stop) and .take(rows) returning float32 rows that are
+# already L2-normalised. Block sources are only ever read block_size rows at a
+# time, so a quantised or memory-mapped store is never widened to float32 whole.
+
+def _is_block_source(matrix):
+    return hasattr(matrix, "dense") and hasattr(matrix, "take")
+
+
+def _as_source(matrix):
+    return matrix if _is_block_source(matrix) else normalize_rows(matrix)
+
+
+def _slice_rows(source, start, stop):
+    return source.dense(start, stop) if _is_block_source(source) else source[start:stop]
+
+
+def _take_rows(source, rows):
+    return source.take(rows) if _is_block_source(source) else source[rows]
+
+
+def _scores_against(left, source, start=0, block_size=1024):
+    # Dense float32 scores of the rows in left against rows start: of source
+    if not _is_block_source(source):
+        block = left @ source[start:].T
+        if issparse(block):
+            block = block.toarray()
+        return np.asarray(block, dtype=np.float32)
+
+    n = source.shape[0]
+    scores = np.empty((left.shape[0], n - start), dtype=np.float32)
+    for col_start in range(start, n, block_size):
+        col_stop = min(col_start + block_size, n)
+        scores[:, col_start - start:col_stop - start] = left @ source.dense(col_start, col_stop).T
+    return scores
+
+
+def all_pairs_similarity(teams, matrix, block_size=1024):
+    """
+    Cosine similarity of every unordered pair of rows, upper triangle only.
+
+    The product is computed block_size rows at a time against the remaining
+    rows, so peak memory is block_size x n instead of n x n.
+
+    Returns:
+    - PairScores in the same (i, j > i) order as the legacy nested loops.
+    """
+    n = len(teams)
+    if n < 2:
+        return PairScores(teams, [], [], [])
+
+    source = _as_source(matrix)
+    rows, cols, scores = [], [], []
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = _scores_against(_slice_rows(source, start, stop), source, start, block_size)
+
+        local_rows, local_cols = np.triu_indices(stop - start, 1, m=n - start)
+        rows.append(local_rows + start)
+        cols.append(local_cols + start)
+        scores.append(np.asarray(block[local_rows, local_cols], dtype=np.float32))
+
+    return PairScores(teams, np.concatenate(rows), np.concatenate(cols), np.concatenate(scores))
+
+
+def _global_pair_keys(pairs, team_index):
+    # Map a channel's local (row, col) indices onto the shared team list and encode
+    # each unordered pair as one int64 key: i * n + j with i < j
+    n = len(team_index)
+    remap = np.array([team_index[team] for team in pairs.teams], dtype=np.int64)
+    i = remap[pairs.rows]
+    j = remap[pairs.cols]
+    return np.minimum(i, j) * n + np.maximum(i, j)
+
+
+def union_pairs(*pair_scores):
+    """
+    Unique unordered pairs covered by any of the given PairScores, matched by team
+    name. Scores are NaN: the result lists pairs to score, e.g. with score_pairs.
+    """
+    team_index = {}
+    for pairs in pair_scores:
+        for team in pairs.teams:
+            team_index.setdefault(team, len(team_index))
+    teams = list(team_index.keys())
+    n = max(len(teams), 1)
+
+    keys = [_global_pair_keys(pairs, team_index) for pairs in pair_scores if len(pairs)]
+    if not keys:
+        return PairScores(teams, [], [], [])
+    keys = np.unique(np.concatenate(keys))
+    return PairScores(teams, keys // n, keys % n, np.full(len(keys), np.nan, dtype=np.float32))
+
+
+def aligned_scores(pairs, reference):
+    """
+    Scores of pairs at each of reference's pairs, matched by team names.
+
+    Returns:
+    - float32 array of len(reference); NaN where pairs has no score for the pair.
+    """
+    aligned = np.full(len(reference), np.nan, dtype=np.float32)
+    if len(pairs) == 0 or len(reference) == 0:
+        return aligned
+
+    team_index = {team: i for i, team in enumerate(reference.teams)}
+    n = len(team_index)
+    reference_keys = _global_pair_keys(reference, team_index)
+
+    remap = np.array([team_index.get(team, -1) for team in pairs.teams], dtype=np.int64)
+    i, j = remap[pairs.rows], remap[pairs.cols]
+    known = (i >= 0) & (j >= 0)
+    keys = np.minimum(i, j)[known] * n + np.maximum(i, j)[known]
+
+    order = np.argsort(reference_keys, kind="stable")
+    positions = np.minimum(np.searchsorted(reference_keys[order], keys), len(order) - 1)
+    found = reference_keys[order][positions] == keys
+    aligned[order[positions[found]]] = pairs.scores[known][found]
+    return aligned
+
+
+def composite_scores(channel_pairs, weights):
+    """
+    Weighted blend of several channels' PairScores, aligned by team identity.
+
+    Parameters:
+    - channel_pairs (dict): {channel_name: PairScores}
+    - weights (dict): {channel_name: weight}
+
+    Channels are matched on team names rather than on position, so a channel that
+    skipped or failed some documents only drops out of the pairs it has no score
+    for. Those pairs are blended from the remaining channels with their weights
+    renormalised to sum to one.
+
+    Returns:
+    - PairScores over the union of all teams and pairs.
+    """
+    team_index = {}
+    for pairs in channel_pairs.values():
+        for team in pairs.teams:
+            team_index.setdefault(team, len(team_index))
+    teams = list(team_index.keys())
+    n = len(teams)
+
+    channel_keys = {name: _global_pair_keys(pairs, team_index) for name, pairs in channel_pairs.items()}
+    if not channel_keys:
+        return PairScores(teams, [], [], [])
+    all_keys = np.unique(np.concatenate(list(channel_keys.values())))
+
+    weighted_sum = np.zeros(len(all_keys), dtype=np.float64)
+    weight_total = np.zeros(len(all_keys), dtype=np.float64)
+    for name, pairs in channel_pairs.items():
+        weight = weights.get(name, 0.0)
+        if weight == 0 or len(pairs) == 0:
+            continue
+        # NaN marks a pair the channel did not score
+        present = ~np.isnan(pairs.scores)
+        positions = np.searchsorted(all_keys, channel_keys[name][present])
+        weighted_sum[positions] += weight * pairs.scores[present]
+        weight_total[positions] += weight
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where(weight_total > 0, weighted_sum / weight_total, np.nan)
+
+    return PairScores(teams, all_keys // max(n, 1), all_keys % max(n, 1), scores)
+
+
+class NeighbourIndex:
+    """
+    Exact blocked nearest-neighbour index over L2-normalised rows.
+
+    Queries are scored block_size rows at a time and only each row's top k are
+    kept (np.argpartition), so searching a large archive never materialises the
+    full query x index similarity matrix.
+    """
+
+    def __init__(self, matrix, block_size=1024):
+        self.matrix = _as_source(matrix)
+        self.block_size = block_size
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, queries, k=10, exclude_self=False):
+        """
+        Returns:
+        - (indices, scores): int64 and float32 arrays of shape (len(queries), k),
+          best match first. With exclude_self, query i is assumed to be index row i
+          and never returned as its own neighbour.
+        """
+        queries = normalize_rows(queries)
+        n_queries = queries.shape[0]
+        k = max(0, min(k, len(self) - (1 if exclude_self else 0)))
+        indices = np.zeros((n_queries, k), dtype=np.int64)
+        scores = np.zeros((n_queries, k), dtype=np.float32)
+        if k == 0:
+            return indices, scores
+
+        for start in range(0, n_queries, self.block_size):
+            stop = min(start + self.block_size, n_queries)
+            block = _scores_against(queries[start:stop], self.matrix, block_size=self.block_size)
+            if exclude_self:
+                local = np.arange(stop - start)
+                block[local, local + start] = -np.inf
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            indices[start:stop] = np.take_along_axis(top, order, axis=1)
+            scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+        return indices, scores
+
+
+def candidate_pairs(teams, matrix, k=10, threshold=None, block_size=1024):
+    """
+    Candidate pairs from each team's k nearest neighbours instead of all pairs.
+
+    Parameters:
+    - k (int): Neighbours kept per team.
+    - threshold (float): Optional; drop neighbours scoring below this.
+
+    Returns:
+    - PairScores of the unique unordered candidate pairs, scored on this matrix.
+    """
+    n = len(teams)
+    index = NeighbourIndex(matrix, block_size=block_size)
+    neighbours, scores = index.search(matrix, k=k, exclude_self=True)
+
+    rows = np.repeat(np.arange(n, dtype=np.int64), neighbours.shape[1])
+    cols = neighbours.ravel()
+    scores = scores.ravel()
+    if threshold is not None:
+        keep = scores >= threshold
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    keys, first = np.unique(np.minimum(rows, cols) * n + np.maximum(rows, cols), return_index=True)
+    return PairScores(teams, keys // max(n, 1), keys % max(n, 1), scores[first])
+
+
+def score_pairs(teams, matrix, pair_teams, block_size=65536):
+    """
+    Cosine similarity for a given list of pairs only.
+
+    Parameters:
+    - teams (list): Row labels of matrix.
+    - pair_teams (PairScores): Pairs to score, identified by team name. Pairs that
+      involve a team missing from teams are skipped.
+
+    Returns:
+    - PairScores over pair_teams.teams.
+    """
+    source = _as_source(matrix)
+    position = {team: i for i, team in enumerate(teams)}
+    lookup = np.array([position.get(team, -1) for team in pair_teams.teams], dtype=np.int64)
+    if len(lookup) == 0:
+        return PairScores(pair_teams.teams, [], [], [])
+    local_rows = lookup[pair_teams.rows]
+    local_cols = lookup[pair_teams.cols]
+    keep = (local_rows >= 0) & (local_cols >= 0)
+    local_rows, local_cols = local_rows[keep], local_cols[keep]
+
+    scores = np.zeros(len(local_rows), dtype=np.float32)
+    for start in range(0, len(local_rows), block_size):
+        stop = min(start + block_size, len(local_rows))
+        left = _take_rows(source, local_rows[start:stop])
+        right = _take_rows(source, local_cols[start:stop])
+        if issparse(left):
+            scores[start:stop] = np.asarray(left.multiply(right).sum(axis=1)).ravel()
+        else:
+            scores[start:stop] = np.einsum("ij,ij->i", left, right)
+
+    return PairScores(pair_teams.teams, pair_teams.rows[keep], pair_teams.cols[keep], scores)
+
+
+def similarity_rows(matrix, rows, block_size=1024):
+    """
+    Dense cosine similarity of the given rows against every row of matrix.
+
+    Returns:
+    - np.ndarray of shape (len(rows), n_rows).
+    """
+    source = _as_source(matrix)
+    rows = np.asarray(rows, dtype=np.int64)
+    result = np.zeros((len(rows), source.shape[0]), dtype=np.float32)
+
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        result[start:stop] = _scores_against(_take_rows(source, rows[start:stop]), source, block_size=block_size)
+
+    return result
+
+
+def pairs_from_matrix(teams, scores):
+    # Upper triangle of a square score matrix as PairScores
+    rows, cols = np.triu_indices(len(teams), 1)
+    return PairScores(teams, rows, cols, scores[rows, cols])
@@ -0,0 +1,64 @@
+import json
+import os
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+import cohort_state
+from cohort_state import CohortState, cohort_path, cohort_version
+from embedding_store import EmbeddingStore
+
+
+def test_cohort_version_changes_when_the_saved_state_changes(tmp_path):
+    assert cohort_version("section-a", tmp_path) is None
+
+    state_dir = cohort_path("section-a", tmp_path)
+    os.makedirs(state_dir)
+    state_file = os.path.join(state_dir, "state.json")
+    with open(state_file, "w") as f:
+        json.dump({"teams": ["0001"], "fingerprints": ["a"], "settings": {}}, f)
+    first = cohort_version("section-a", tmp_path)
+    assert first == cohort_version("section-a", tmp_path)
+
+    with open(state_file, "w") as f:
+        json.dump({"teams": ["0001", "0002"], "fingerprints": ["a", "b"], "settings": {}}, f)
+    assert cohort_version("section-a", tmp_path) != first
+
+
+def _state(state_dir, teams):
+    state = CohortState(state_dir)
+    state.teams = list(teams)
+    state.fingerprints = [f"hash-{team}" for team in teams]
+    state.settings = {"context_model": "model"}
+    vectors = np.eye(len(teams), 4, dtype=np.float32)
+    state.vectors = {"context": EmbeddingStore.from_matrix(teams, vectors, dtype="float32")}
+    state.scores = {"context": vectors @ vectors.T}
+    state.term_counts = csr_matrix(np.ones((len(teams), 3)))
+    state.vocabulary = {"a": 0, "b": 1, "c": 2}
+    return state
+
+
+def test_a_failed_save_leaves_the_previous_state_intact(tmp_path, monkeypatch):
+    state_dir = str(tmp_path / "cohort")
+    _state(state_dir, ["0001", "0002"]).save()
+    version = cohort_version("cohort", tmp_path)
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    # New vectors and scores are written, then the save dies
+    monkeypatch.setattr(cohort_state, "save_npz", crash)
+    with pytest.raises(OSError):
+        _state(state_dir, ["0001", "0002", "0003"]).save()
+    monkeypatch.undo()
+
+    state = CohortState.load(state_dir)
+    assert state.teams == ["0001", "0002"]
+    assert state.vectors["context"].shape == (2, 4)
+    assert state.scores["context"].shape == (2, 2)
+    assert cohort_version("cohort", tmp_path) == version
+
+    _state(state_dir, ["0001", "0002", "0003"]).save()
+    state = CohortState.load(state_dir)
+    assert state.scores["context"].shape == (3, 3)
+    # Only the current save's directory is left
+    assert sorted(os.listdir(state_dir)) == sorted(["CURRENT", os.path.basename(state.data_dir)])
@@ -0,0 +1,74 @@
+import numpy as np
+from calculate_similarity import DEFAULT_WEIGHTS, calculate_composite_pairs, calculate_composite_similarity, composite_weights
+from similarity_engine import PairScores, aligned_scores, pair_label
+
+
+def _channel(teams, rng):
+    pairs = [(a, b) for i, a in enumerate(teams) for b in teams[i + 1:]]
+    return {pair_label(a, b): float(rng.random()) for a, b in pairs}
+
+
+def _reversed_labels(channel):
+    flipped = {}
+    for label, score in channel.items():
+        current_team, other_team = label[len("Team "):].split(" and Team ")
+        flipped[pair_label(other_team, current_team)] = score
+    return flipped
+
+
+def test_dict_composite_merges_pairs_listed_in_reverse_team_order():
+    rng = np.random.default_rng(0)
+    teams = [f"{i:04d}" for i in range(50)]
+    context, tfidf, paraphrase = _channel(teams, rng), _channel(teams, rng), _channel(teams, rng)
+
+    expected = calculate_composite_similarity(context, tfidf, paraphrase)
+    composite = calculate_composite_similarity(context, _reversed_labels(tfidf), paraphrase)
+
+    assert len(composite) == 50 * 49 // 2
+    assert composite.keys() == expected.keys()
+    for label, score in expected.items():
+        assert np.isclose(composite[label], score)
+
+
+def test_dict_composite_renormalises_missing_channel():
+    context = {pair_label("A", "B"): 0.5}
+    tfidf = {pair_label("B", "A"): 1.0}
+    composite = calculate_composite_similarity(context, tfidf, {})
+
+    weights = DEFAULT_WEIGHTS["context"] + DEFAULT_WEIGHTS["tfidf"]
+    assert list(composite) == [pair_label("A", "B")]
+    assert np.isclose(composite[pair_label("A", "B")],
+                      (DEFAULT_WEIGHTS["context"] * 0.5 + DEFAULT_WEIGHTS["tfidf"] * 1.0) / weights)
+
+
+def test_pair_composite_matches_teams_by_name():
+    context = PairScores(["A", "B", "C"], [0, 0, 1], [1, 2, 2], [0.9, 0.1, 0.2])
+    # Same pairs with the team list in another order
+    tfidf = PairScores(["C", "B", "A"], [0, 0, 1], [1, 2, 2], [0.2, 0.1, 0.9])
+    composite = calculate_composite_pairs(context, tfidf, context)
+
+    scores = dict(zip(composite.labels(), composite.scores))
+    assert len(scores) == 3
+    assert np.isclose(scores[pair_label("A", "B")], 0.9)
+    assert np.isclose(scores[pair_label("A", "C")], 0.1)
+
+
+def test_composite_weights_sum_to_one_with_minhash():
+    weights = composite_weights(0.2)
+
+    assert np.isclose(sum(weights.values()), 1.0)
+    assert np.isclose(weights["minhash"], 0.2)
+    assert np.isclose(weights["context"] / weights["tfidf"], DEFAULT_WEIGHTS["context"] / DEFAULT_WEIGHTS["tfidf"])
+    assert composite_weights(0.0) == DEFAULT_WEIGHTS
+
+
+def test_aligned_scores_matches_pairs_by_team_names():
+    reference = PairScores(["A", "B", "C"], [0, 0, 1], [1, 2, 2], [0.1, 0.2, 0.3])
+    # Different team order, one pair missing and one team the reference lacks
+    channel = PairScores(["C", "D", "A"], [0, 0, 1], [2, 1, 2], [0.9, 0.5, 0.7])
+
+    aligned = aligned_scores(channel, reference)
+
+    assert np.isnan(aligned[0])
+    assert np.isclose(aligned[1], 0.9)
+    assert np.isnan(aligned[2])
@@ -0,0 +1,33 @@
+import zipfile
+import fitz
+from document_store import extract_documents_from_zip, get_team_name
+
+
+def _pdf(text):
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), text)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def test_reports_with_the_same_team_name_are_both_kept(tmp_path):
+    zip_path = tmp_path / "cohort.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        zip_ref.writestr("Team 0001.pdf", _pdf("first report"))
+        zip_ref.writestr("late/Team 0001.pdf", _pdf("second report"))
+        zip_ref.writestr("Team 0002.pdf", _pdf("another team"))
+
+    corpus = extract_documents_from_zip(str(zip_path))
+
+    assert len(corpus) == 3
+    assert corpus.errors == {}
+    assert "0001" in corpus.documents
+    assert "0001 (late/Team 0001.pdf)" in corpus.documents
+    assert "second report" in corpus.documents["0001 (late/Team 0001.pdf)"].text
+
+
+def test_team_name_strips_the_extension_in_any_case():
+    assert get_team_name("sub/Team 0001.pdf") == "0001"
+    assert get_team_name("Team X.PDF") == "X"
+    assert get_team_name("report.Pdf") == "report"
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from embed import iter_encoded_documents, truncate_embeddings
+
+
+def test_truncate_embeddings_keeps_leading_components_normalised():
+    embeddings = np.array([[3.0, 4.0, 12.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+
+    truncated = truncate_embeddings(embeddings, 2)
+
+    assert truncated.shape == (2, 2)
+    assert np.allclose(truncated[0], [0.6, 0.8])
+    assert np.allclose(truncated[1], [0.0, 0.0])
+    assert truncate_embeddings(embeddings, 3) is embeddings
+
+
+@pytest.mark.parametrize("dim", [0, -1])
+def test_truncate_embeddings_rejects_non_positive_dim(dim):
+    with pytest.raises(ValueError):
+        truncate_embeddings(np.ones((2, 4), dtype=np.float32), dim)
+
+
+class _FakeModel:
+    # Deterministic stand-in for a SentenceTransformer; records how many texts each call got
+    dimension = 8
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.calls.append(len(texts))
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i, sum(map(ord, text)) % self.dimension] = 1.0
+            vectors[i, len(text) % self.dimension] += 1.0
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+def _chunks():
+    return {
+        "A": [f"a{i}" for i in range(5)],
+        "empty-first": [],
+        "B": [f"b{i}" for i in range(7)],
+        "C": ["c0"],
+        "empty-last": [],
+    }
+
+
+@pytest.mark.parametrize("slice_size", [1, 2, 3, 5, 6, 100])
+def test_iter_encoded_documents_matches_encoding_each_document_alone(slice_size):
+    model = _FakeModel()
+    chunks = _chunks()
+
+    encoded = list(iter_encoded_documents(chunks, model=model, slice_size=slice_size))
+    calls = list(model.calls)
+
+    assert [team for team, _ in encoded] == list(chunks)
+    assert sum(calls) == 13 and max(calls) <= slice_size
+    for team, embeddings in encoded:
+        assert embeddings.shape == (len(chunks[team]), model.dimension)
+        if chunks[team]:
+            assert np.array_equal(embeddings, model.encode(chunks[team]))
+
+
+def test_iter_encoded_documents_accepts_generators_and_reports_progress():
+    model = _FakeModel()
+    chunks = _chunks()
+    lazy = {team: (chunk for chunk in team_chunks) for team, team_chunks in chunks.items()}
+    progress = []
+    timings = {}
+
+    encoded = dict(iter_encoded_documents(lazy, model=model, slice_size=4,
+                                          progress=lambda stage, done, total: progress.append((done, total)),
+                                          timings=timings))
+
+    for team, team_chunks in chunks.items():
+        assert len(encoded[team]) == len(team_chunks)
+    # Chunk counts of generators are unknown up front
+    assert progress == [(4, None), (8, None), (12, None), (13, None)]
+    assert set(timings) == {"A", "B", "C"}
+
+
+def test_iter_encoded_documents_yields_each_team_once_its_chunks_are_encoded():
+    model = _FakeModel()
+    stream = iter_encoded_documents({"A": ["a0", "a1"], "B": ["b0", "b1", "b2"]}, model=model, slice_size=2)
+
+    team, _ = next(stream)
+    # "A" fills the first slice exactly, so it is complete before "B" is read
+    assert team == "A" and model.calls == [2]
@@ -0,0 +1,59 @@
+import os
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+def _entry(seed):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=8).astype(np.float32), rng.normal(size=(5, 8)).astype(np.float32)
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    key = cache.make_key("hash", "model", 256, 64)
+    document, chunks = _entry(0)
+
+    assert cache.get(key) is None
+    cache.put(key, document, chunks)
+    cached_document, cached_chunks = cache.get(key)
+
+    assert cached_document.dtype == np.float32 and np.array_equal(cached_document, document)
+    assert cached_chunks.dtype == np.float16 and np.allclose(cached_chunks, chunks, atol=1e-2)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_keys_change_with_every_input():
+    key = EmbeddingCache.make_key("hash", "model", 256, 64)
+    assert key == EmbeddingCache.make_key("hash", "model", 256, 64)
+    assert len({key,
+                EmbeddingCache.make_key("other", "model", 256, 64),
+                EmbeddingCache.make_key("hash", "other", 256, 64),
+                EmbeddingCache.make_key("hash", "model", 512, 64),
+                EmbeddingCache.make_key("hash", "model", 256, 0),
+                EmbeddingCache.make_key("hash", "model", 256, 64, variant="dim=128")}) == 6
+
+
+def test_a_damaged_entry_is_a_miss(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    with open(os.path.join(tmp_path, "broken.npz"), "wb") as f:
+        f.write(b"not an npz file")
+    assert cache.get("broken") is None
+
+
+def test_evict_removes_least_recently_used_entries_first(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    for i, key in enumerate(("old", "middle", "new")):
+        cache.put(key, *_entry(i))
+        # Spread the last-used times apart, oldest first
+        os.utime(os.path.join(tmp_path, f"{key}.npz"), (1_000_000 + i, 1_000_000 + i))
+    entry_size = os.path.getsize(os.path.join(tmp_path, "old.npz"))
+
+    # Reading "old" makes it the most recently used entry
+    assert cache.get("old") is not None
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+
+    assert sorted(os.listdir(tmp_path)) == ["new.npz", "old.npz"]
+    cache.max_bytes = 0
+    cache.evict()
+    assert os.listdir(tmp_path) == []
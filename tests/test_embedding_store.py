@@ -0,0 +1,33 @@
+import numpy as np
+from embedding_store import EmbeddingStore, check_precision
+from similarity_engine import NeighbourIndex, all_pairs_similarity, score_pairs, similarity_rows
+
+
+def _matrix(n=120, d=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, d)).astype(np.float32)
+
+
+def test_engine_kernels_read_a_float32_store_like_the_matrix():
+    matrix = _matrix()
+    teams = [f"{i:04d}" for i in range(len(matrix))]
+    store = EmbeddingStore.from_matrix(teams, matrix, dtype="float32")
+
+    expected = all_pairs_similarity(teams, matrix, block_size=50)
+    pairs = all_pairs_similarity(teams, store, block_size=50)
+    assert np.array_equal(pairs.rows, expected.rows) and np.array_equal(pairs.cols, expected.cols)
+    assert np.allclose(pairs.scores, expected.scores, atol=1e-6)
+    assert np.allclose(score_pairs(teams, store, expected).scores, expected.scores, atol=1e-6)
+    assert np.allclose(similarity_rows(store, [0, 7], block_size=50), similarity_rows(matrix, [0, 7]), atol=1e-6)
+
+    expected_neighbours, _ = NeighbourIndex(matrix).search(matrix, k=5, exclude_self=True)
+    neighbours, _ = NeighbourIndex(store, block_size=50).search(matrix, k=5, exclude_self=True)
+    assert np.array_equal(neighbours, expected_neighbours)
+
+
+def test_quantised_stores_stay_close_to_float32():
+    matrix = _matrix()
+    report = check_precision([str(i) for i in range(len(matrix))], matrix)
+
+    assert report["float16"]["max_abs_error"] < 1e-3
+    assert report["int8"]["max_abs_error"] < 1e-2
+    assert report["int8"]["bytes"] < report["float16"]["bytes"]
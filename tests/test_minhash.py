@@ -0,0 +1,47 @@
+import random
+from calculate_similarity import find_near_duplicate_pairs
+from minhash import bucket_cap
+from document_store import ExtractedDocument
+from similarity_engine import pair_label
+
+
+def _template_cohort(n_documents, seed=0, copies=1):
+    # Every report: the same template half plus its own random half; reports
+    # 0001 to <copies> are verbatim copies of report 0000
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(5000)]
+    template = " ".join(rng.choice(words) for _ in range(400))
+    documents = {}
+    for i in range(n_documents):
+        text = template + " " + " ".join(rng.choice(words) for _ in range(400))
+        documents[f"{i:04d}"] = ExtractedDocument(f"{i:04d}", "", [text], [])
+    for i in range(1, copies + 1):
+        documents[f"{i:04d}"] = ExtractedDocument(f"{i:04d}", "", list(documents["0000"].pages), [])
+    return documents
+
+
+def test_shared_template_does_not_flood_near_duplicates():
+    documents = _template_cohort(100)
+    unbounded, _ = find_near_duplicate_pairs(documents, max_bucket_fraction=None)
+    bounded, _ = find_near_duplicate_pairs(documents)
+
+    assert len(bounded) < 2 * len(documents) < len(unbounded)
+    assert pair_label("0000", "0001") in bounded.labels()
+
+
+def test_bucket_cap_grows_with_the_cohort():
+    assert bucket_cap(50) == 10
+    assert bucket_cap(1000) == 50
+    assert bucket_cap(1000, max_fraction=None) is None
+
+
+def test_a_solution_copied_by_many_teams_is_still_found_in_a_large_cohort():
+    # 13 teams hand in the same leaked report: more than an absolute cap of 10,
+    # but well below the share of the cohort that template text reaches
+    documents = _template_cohort(300, copies=12)
+    pairs, _ = find_near_duplicate_pairs(documents)
+
+    labels = set(pairs.labels())
+    copies = [f"{i:04d}" for i in range(13)]
+    assert all(pair_label(a, b) in labels for i, a in enumerate(copies) for b in copies[i + 1:])
+    assert len(pairs) < 2 * len(documents)
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+from passage_match import ChunkStore, flagged_teams, match_flagged_pairs
+from similarity_engine import PairScores
+
+
+def test_flagged_teams_only_covers_the_pairs_that_get_matched():
+    pairs = PairScores(["A", "B", "C", "D", "E"], [0, 0, 1, 2, 3], [1, 2, 3, 4, 4], [0.95, 0.5, 0.9, 0.85, 0.1])
+
+    assert flagged_teams(pairs, threshold=0.8) == {"A", "B", "C", "D", "E"}
+    assert flagged_teams(pairs, threshold=0.8, max_pairs=2) == {"A", "B", "D"}
+    assert flagged_teams(pairs, threshold=0.99) == set()
+
+
+def test_match_flagged_pairs_lists_pairs_with_a_report_missing_from_the_store():
+    store = ChunkStore()
+    for team in ("A", "B"):
+        document = SimpleNamespace(chunks=["same text"], chunk_pages=[0], chunk_offsets=[0])
+        store.add(team, [[1.0, 0.0]], document)
+    # C is an earlier cohort member: scored, but its report is not in this upload
+    pairs = PairScores(["A", "B", "C"], [0, 0], [1, 2], [0.95, 0.9])
+
+    skipped = []
+    matches = match_flagged_pairs(store, pairs, threshold=0.8, skipped=skipped)
+
+    assert list(matches) == pairs.labels([0])
+    assert skipped == pairs.labels([1])
@@ -0,0 +1,26 @@
+from profiling import Profiler
+
+
+def test_document_records_merge_encoding_times():
+    profiler = Profiler()
+    profiler.record_document("A", pages=3, cpu_seconds=0.5)
+    profiler.record_document("B", pages=1, cpu_seconds=0.1)
+    profiler.record_encoding("context", {"A": 0.25, "B": 0.125})
+    profiler.record_encoding("paraphrase", {"A": 1.5})
+
+    documents = profiler.to_dict()["documents"]
+
+    assert [record["team"] for record in documents] == ["A", "B"]
+    assert documents[0] == {"team": "A", "pages": 3, "cpu_seconds": 0.5,
+                            "context_encode_seconds": 0.25, "paraphrase_encode_seconds": 1.5}
+    assert "paraphrase_encode_seconds" not in documents[1]
+
+
+def test_stage_records_process_and_thread_cpu_time():
+    profiler = Profiler()
+    with profiler.stage("Work", items=10):
+        sum(i * i for i in range(100_000))
+
+    record = profiler.stages[0]
+    assert record["cpu_seconds"] >= 0
+    assert 0 < record["thread_cpu_seconds"]
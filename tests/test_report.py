@@ -0,0 +1,20 @@
+import json
+import numpy as np
+from create_report import export_flagged_pairs, render_similarity_report
+from similarity_engine import PairScores
+
+
+def test_exports_mark_pairs_screened_out_of_the_paraphrase_channel():
+    pairs = PairScores(["A", "B", "C"], [0, 0, 1], [1, 2, 2], [0.85, 0.95, 0.5])
+    screened = np.array([True, False, True])
+
+    records = json.loads(export_flagged_pairs(pairs, threshold=0.8, fmt="json", screened=screened))
+    assert [(record["teams"], record["paraphrase_screened_out"]) for record in records] == [
+        ("Team A and Team C", False), ("Team A and Team B", True)]
+
+    lines = export_flagged_pairs(pairs, threshold=0.8, screened=screened).decode("utf-8").splitlines()
+    assert lines == ["Teams,Similarity Score,Paraphrase Screened Out",
+                     "Team A and Team C,0.95,False", "Team A and Team B,0.85,True"]
+
+    assert "paraphrase_screened_out" not in json.loads(export_flagged_pairs(pairs, threshold=0.8, fmt="json"))[0]
+    assert render_similarity_report(pairs, screened=screened).startswith(b"%PDF")
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from calculate_similarity import calculate_tfidf_similarity
+from similarity_engine import all_pairs_similarity, normalize_rows, pair_label
+
+
+def _legacy_pairs(teams, vectors):
+    # The nested loops all_pairs_similarity replaced: every unordered pair once,
+    # (current_team, other_team) in dict order, cosine of normalised rows
+    scores = {}
+    for i, current_team in enumerate(teams):
+        for j, other_team in enumerate(teams):
+            if current_team != other_team and pair_label(other_team, current_team) not in scores:
+                scores[pair_label(current_team, other_team)] = float(np.dot(vectors[i], vectors[j]))
+    return scores
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 1024])
+def test_all_pairs_matches_the_legacy_nested_loops(block_size):
+    rng = np.random.default_rng(0)
+    teams = [f"{i:04d}" for i in range(11)]
+    vectors = normalize_rows(rng.normal(size=(len(teams), 16)).astype(np.float32))
+
+    pairs = all_pairs_similarity(teams, vectors, block_size=block_size)
+    expected = _legacy_pairs(teams, vectors)
+
+    assert pairs.labels() == list(expected.keys())
+    assert np.allclose(pairs.scores, list(expected.values()), atol=1e-6)
+    assert np.all(pairs.rows < pairs.cols)
+
+
+def test_all_pairs_matches_the_legacy_loops_on_sparse_tfidf_rows():
+    rng = np.random.default_rng(1)
+    dense = rng.random((7, 30)) * (rng.random((7, 30)) > 0.7)
+    dense[3] = 0  # a document without any vocabulary terms
+    rows = normalize_rows(dense.astype(np.float32))
+    teams = [f"{i:04d}" for i in range(7)]
+    embeddings = {team: csr_matrix(rows[i:i + 1]) for i, team in enumerate(teams)}
+
+    scores = calculate_tfidf_similarity(embeddings)
+    expected = {label: round(score, 2) for label, score in _legacy_pairs(teams, rows).items()}
+
+    assert scores == expected
+
+
+def test_all_pairs_of_fewer_than_two_teams_is_empty():
+    assert len(all_pairs_similarity(["0001"], np.ones((1, 4), dtype=np.float32))) == 0
@@ -0,0 +1,30 @@
+import numpy as np
+from scipy.sparse import vstack
+from similarity_engine import normalize_rows
+from tfidf_embed import count_terms, fit_tfidf_corpus, tfidf_from_counts
+
+TEXTS = [
+    "the project plan covers milestones and testing of the scheduler",
+    "our scheduler design uses a priority queue for milestone tracking",
+    "testing strategy: unit tests for the priority queue and the scheduler",
+    "late submission introducing blockchain ledger consensus vocabulary",
+    "blockchain ledger consensus copied from the late submission",
+]
+
+
+def _cosines(matrix):
+    matrix = normalize_rows(matrix)
+    return (matrix @ matrix.T).toarray()
+
+
+def test_counts_split_across_uploads_match_a_full_fit():
+    vocabulary = {}
+    first = count_terms(TEXTS[:3], vocabulary)
+    second = count_terms(TEXTS[3:], vocabulary)
+    first.resize((first.shape[0], len(vocabulary)))
+    merged = tfidf_from_counts(vstack([first, second]).tocsr())
+
+    _, full = fit_tfidf_corpus(TEXTS)
+    assert np.allclose(_cosines(merged), _cosines(full))
+    # Terms that only appear in the later upload still count
+    assert _cosines(merged)[3, 4] > 0.3
@@ -1,40 +1,92 @@
 import fitz  # PyMuPDF
 import os
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
 
 
+def extract_text_from_pdf(pdf_path):
+    doc = fitz.open(pdf_path)
+    text = "".join(page.get_text() for page in doc)
+    doc.close()
+    return text
 
-def create_vocab():
-    def extract_text_from_pdf(pdf_path):
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
-        return text
 
-    pdf_folder = "extracted_files"
-    all_texts = []
+def create_vectorizer():
+    return TfidfVectorizer(
+                            stop_words='english',
+                            ngram_range=(1,2))
 
-    for filename in os.listdir(pdf_folder):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(pdf_folder, filename)
-            text = extract_text_from_pdf(file_path)
-            all_texts.append(text)
 
+def create_vocab(all_texts=None):
+    # Legacy behaviour: read every PDF in the shared folder when no texts are given
+    if all_texts is None:
+        pdf_folder = "extracted_files"
+        all_texts = (
+            extract_text_from_pdf(os.path.join(pdf_folder, filename))
+            for filename in os.listdir(pdf_folder)
+            if filename.endswith(".pdf")
+        )
 
-
-    vectorizer = TfidfVectorizer(
-                                stop_words='english',
-                                ngram_range=(1,2))
-
+    vectorizer = create_vectorizer()
     vectorizer.fit(all_texts)
     return vectorizer
 
 
-def embed_using_tfidf(text):
-  vectorizer = create_vocab()  # Assuming pdf_list is not needed here
+def fit_tfidf_corpus(all_texts):
+    """
+    Fit one TF-IDF vocabulary over the whole corpus and vectorize it in the same pass.
+
+    Parameters:
+    - all_texts (iterable): One full-text string per document. A generator is
+      consumed once, so only one document's text needs to be in memory at a time.
+
+    Returns:
+    - (vectorizer, matrix): The fitted vectorizer and a sparse CSR matrix with one
+      L2-normalised row per document, in the order of all_texts.
+    """
+    vectorizer = create_vectorizer()
+    matrix = vectorizer.fit_transform(all_texts)
+    return vectorizer, matrix.tocsr()
+
+
+def count_terms(all_texts, vocabulary):
+    """
+    Raw term counts of each text with the analyzer of create_vectorizer.
+
+    Parameters:
+    - all_texts (iterable): One full-text string per document, consumed once.
+    - vocabulary (dict): {term: column}; terms not seen before are added to it, so
+      a vocabulary kept across calls only ever grows.
+
+    Returns:
+    - Sparse CSR matrix (documents x len(vocabulary)) of term counts.
+    """
+    analyzer = create_vectorizer().build_analyzer()
+    indptr, indices, counts = [0], [], []
+    for text in all_texts:
+        row = {}
+        for term in analyzer(text):
+            column = vocabulary.setdefault(term, len(vocabulary))
+            row[column] = row.get(column, 0) + 1
+        indices.extend(row.keys())
+        counts.extend(row.values())
+        indptr.append(len(indices))
+
+    return csr_matrix((np.array(counts, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                      shape=(len(indptr) - 1, len(vocabulary)))
+
+
+def tfidf_from_counts(counts):
+    """
+    TF-IDF rows from raw term counts, weighted with the IDF of exactly these
+    documents; equal to fit_tfidf_corpus on the same texts up to column order.
+    """
+    return TfidfTransformer().fit_transform(counts).tocsr()
+
+
+def embed_using_tfidf(text, vectorizer=None):
+  if vectorizer is None:
+      vectorizer = create_vocab()
   vectorized_text = vectorizer.transform([text])
   return vectorized_text.toarray()
-
- 